@@ -0,0 +1,97 @@
+""" Measures the time it takes to render the links of the homepage widgets,
+with and without the cache of the class links.
+
+Run with (the file has to be given explicitly)::
+
+    py.test benchmarks/bench_class_links.py --benchmark-output=results.json
+
+"""
+
+import time
+
+from onegov.form import FormCollection
+from onegov.org.layout import DefaultLayout
+from onegov.org.models import ImageSetCollection, PublicationCollection
+from onegov.org.request import OrgRequest
+from onegov.people import PersonCollection
+from onegov.reservation import ResourceCollection
+from onegov.town.homepage_widgets import ContactsAndAlbumsWidget
+from onegov.town.homepage_widgets import ServicesWidget
+from onegov.town.request import TownRequest
+from webob.request import BaseRequest
+
+
+#: the classes linked by the homepage widgets
+CLASSES = (
+    FormCollection,
+    PublicationCollection,
+    ResourceCollection,
+    PersonCollection,
+    ImageSetCollection,
+)
+
+#: the number of renderings per measured run
+REPETITIONS = 100
+
+
+def measure(fn, runs):
+    fn()  # warm up
+
+    durations = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+
+        for repetition in range(REPETITIONS):
+            fn()
+
+        durations.append((time.perf_counter() - start) / REPETITIONS)
+
+    durations.sort()
+
+    return {
+        'runs': runs,
+        'min_us': durations[0] * 1000000,
+        'mean_us': sum(durations) / runs * 1000000,
+        'max_us': durations[-1] * 1000000,
+    }
+
+
+def test_class_links_benchmark(town_app, benchmark_runs, benchmark_results,
+                               monkeypatch):
+
+    environ = BaseRequest.blank('/', base_url='https://govikon.ch').environ
+    request = town_app.request_class(environ=environ, app=town_app)
+    layout = DefaultLayout(town_app.org, request)
+
+    services = ServicesWidget()
+    contacts = ContactsAndAlbumsWidget()
+
+    def links():
+        for cls in CLASSES:
+            request.class_link(cls)
+
+    def widgets():
+        services.get_services_panel(layout)
+        contacts.get_variables(layout)
+
+    results = benchmark_results['class_links'] = {}
+
+    results['cached'] = {
+        'links': measure(links, benchmark_runs),
+        'widgets': measure(widgets, benchmark_runs),
+    }
+
+    monkeypatch.setattr(TownRequest, 'class_link', OrgRequest.class_link)
+
+    results['uncached'] = {
+        'links': measure(links, benchmark_runs),
+        'widgets': measure(widgets, benchmark_runs),
+    }
+
+    for name in ('links', 'widgets'):
+        print("{}: {:.1f}us cached, {:.1f}us uncached".format(
+            name,
+            results['cached'][name]['mean_us'],
+            results['uncached'][name]['mean_us']
+        ))
@@ -0,0 +1,201 @@
+""" Measures the latency, the number of SQL statements and the allocations
+of the town homepage, the topic pages and the homepage settings, with
+realistic data volumes.
+
+Run with (the file has to be given explicitly)::
+
+    py.test benchmarks/bench_homepage.py --benchmark-output=results.json
+
+The results contain the percentiles of the latency, the number of SQL
+statements and the peak allocations per request of each view, as well as
+the seeded data volumes.
+
+"""
+
+import time
+import tracemalloc
+import transaction
+
+from datetime import datetime, timedelta
+from onegov.core.utils import module_path
+from onegov.event import EventCollection
+from onegov.org.models import GeneralFileCollection, ImageFileCollection
+from onegov.org.models import ImageSetCollection
+from onegov.page import PageCollection
+from onegov.people import PersonCollection
+from onegov_testing import Client
+from pathlib import Path
+from sedate import replace_timezone
+from sqlalchemy import event
+
+
+#: the seeded data volumes (multiplied by --benchmark-scale)
+VOLUMES = {
+    'events': 1000,
+    'news': 250,
+    'topics': 250,
+    'publications': 200,
+    'people': 500,
+    'imagesets': 50,
+}
+
+#: the number of images per image set
+IMAGES_PER_SET = 10
+
+#: every n-th event is a weekly event, repeated for eight weeks
+RECURRING_EVENTS = 4
+
+
+def seed(app, scale):
+    session = app.session()
+    volumes = {k: int(v * scale) for k, v in VOLUMES.items()}
+
+    start = replace_timezone(datetime.today(), 'UTC')
+    events = EventCollection(session)
+
+    for i in range(volumes['events']):
+        begin = start + timedelta(days=i % 60, hours=i % 12)
+        recurrence = None
+
+        if i % RECURRING_EVENTS == 0:
+            recurrence = 'RRULE:FREQ=WEEKLY;COUNT=8'
+
+        e = events.add(
+            title=f'Event {i}',
+            start=begin,
+            end=begin + timedelta(hours=2),
+            timezone='Europe/Zurich',
+            recurrence=recurrence,
+            tags=['Party'] if i % 2 else ['Politics'],
+            location=f'Location {i}',
+            content={'description': f'Description {i}'},
+            autoclean=False
+        )
+        e.submit()
+        e.publish()
+
+    pages = PageCollection(session)
+    news = pages.by_path('news')
+    topics = [p for p in pages.roots() if p.type == 'topic']
+
+    for i in range(volumes['news']):
+        pages.add(news, f'News {i}', type='news', lead=f'Lead {i}')
+
+    for i in range(volumes['topics']):
+        pages.add(topics[i % len(topics)], f'Topic {i}', type='topic',
+                  lead=f'Lead {i}')
+
+    pdf = Path(module_path('onegov.org', 'tests/fixtures/sample.pdf'))
+    pdf = pdf.read_bytes()
+
+    files = GeneralFileCollection(session)
+
+    for i in range(volumes['publications']):
+        files.add(filename=f'Publication {i}.pdf', content=pdf).signed = True
+
+    people = PersonCollection(session)
+
+    for i in range(volumes['people']):
+        people.add(first_name=f'First {i}', last_name=f'Last {i}',
+                   function=f'Function {i % 20}')
+
+    images = Path(module_path('onegov.org', 'content/images'))
+    images = [p.read_bytes() for p in sorted(images.glob('*.jpg'))]
+
+    imagesets = ImageSetCollection(session)
+    imagefiles = ImageFileCollection(session)
+
+    for i in range(volumes['imagesets']):
+        imageset = imagesets.add(title=f'Album {i}')
+        imageset.show_images_on_homepage = i % 5 == 0
+
+        for j in range(IMAGES_PER_SET):
+            imageset.files.append(imagefiles.add(
+                filename=f'{i}-{j}.jpg', content=images[j % len(images)]))
+
+    transaction.commit()
+    return volumes
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def measure(client, path, runs, statements):
+    client.get(path)  # warm up
+
+    latencies = []
+    queries = []
+
+    for i in range(runs):
+        del statements[:]
+
+        start = time.perf_counter()
+        client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        queries.append(len(statements))
+
+    # tracing the allocations slows the requests down, so the allocations
+    # are measured separately
+    allocations = []
+
+    for i in range(min(runs, 10)):
+        tracemalloc.start()
+        client.get(path)
+        allocations.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        'runs': runs,
+        'latency_ms': {
+            'min': min(latencies),
+            'mean': sum(latencies) / runs,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies),
+        },
+        'queries': {
+            'min': min(queries),
+            'max': max(queries),
+        },
+        'peak_allocation_bytes': max(allocations),
+    }
+
+
+def test_homepage_benchmark(town_app, benchmark_runs, benchmark_scale,
+                            benchmark_results):
+
+    benchmark_results['volumes'] = seed(town_app, benchmark_scale)
+    views = benchmark_results['views'] = {}
+
+    statements = []
+
+    def count_statement(*args, **kwargs):
+        statements.append(args[2])
+
+    engine = town_app.session_manager.engine
+    event.listen(engine, 'before_cursor_execute', count_statement)
+
+    try:
+        client = Client(town_app)
+
+        paths = ['/'] + [
+            '/topics/' + page.name
+            for page in PageCollection(town_app.session()).roots()
+            if page.type == 'topic'
+        ]
+
+        for path in paths:
+            views[path] = measure(
+                client, path, benchmark_runs, statements)
+
+        client.login_admin()
+
+        views['/homepage-settings'] = measure(
+            client, '/homepage-settings', benchmark_runs, statements)
+
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_statement)
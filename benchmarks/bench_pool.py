@@ -0,0 +1,123 @@
+""" Measures the throughput of many towns sharing one process, with the
+default session manager of onegov.core and with the schema pinned pool
+(see :mod:`onegov.town.pool`).
+
+Each request selects a town (most requests go to a few popular towns) and
+runs a few small queries in its schema, like a simple view would.
+
+Run with (the file has to be given explicitly)::
+
+    py.test benchmarks/bench_pool.py --benchmark-output=results.json
+
+The number of towns is 200 times --benchmark-scale.
+
+"""
+
+import random
+import time
+import transaction
+
+from onegov.core.orm import ModelBase, SessionManager
+from onegov.town.pool import SchemaPinnedSessionManager
+from sqlalchemy import Column, Integer, Text
+from sqlalchemy.ext.declarative import declarative_base
+
+
+#: the number of towns (multiplied by --benchmark-scale)
+TOWNS = 200
+
+#: the number of queries per request
+QUERIES = 5
+
+#: the number of requests per measured run
+REQUESTS = 200
+
+Base = declarative_base(cls=ModelBase)
+
+
+class Document(Base):
+    __tablename__ = 'benchmark_documents'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(Text)
+
+
+def seed(mgr, schemas):
+    for schema in schemas:
+        mgr.set_current_schema(schema)
+        mgr.session().add(Document(title=schema))
+        transaction.commit()
+
+
+def workload(schemas, requests, seed=42):
+    """ Returns the schemas of the given number of requests, following a
+    power law: the first towns get most of the requests.
+
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(schemas))]
+
+    return rng.choices(schemas, weights=weights, k=requests)
+
+
+def measure(mgr, requests, runs):
+    durations = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+
+        for schema in requests:
+            mgr.set_current_schema(schema)
+            session = mgr.session()
+
+            for query in range(QUERIES):
+                session.query(Document.title).first()
+
+            transaction.commit()
+
+        durations.append(time.perf_counter() - start)
+
+    durations.sort()
+
+    return {
+        'runs': runs,
+        'requests_per_second': len(requests) / durations[len(durations) // 2],
+        'min_ms': durations[0] / len(requests) * 1000,
+        'median_ms': durations[len(durations) // 2] / len(requests) * 1000,
+    }
+
+
+def test_pool_benchmark(postgres_dsn, benchmark_runs, benchmark_scale,
+                        benchmark_results):
+
+    schemas = [f'town-{i}' for i in range(int(TOWNS * benchmark_scale))]
+    requests = workload(schemas, REQUESTS)
+    runs = max(benchmark_runs // 10, 1)
+
+    results = benchmark_results['pool'] = {'towns': len(schemas)}
+
+    default = SessionManager(postgres_dsn, Base)
+    seed(default, schemas)
+
+    try:
+        results['default'] = measure(default, requests, runs)
+    finally:
+        default.dispose()
+
+    pinned = SchemaPinnedSessionManager(postgres_dsn, Base, pool_size=20)
+
+    try:
+        results['pinned'] = measure(pinned, requests, runs)
+        results['pinned']['stats'] = dict(pinned.pool_stats)
+        results['pinned']['hit_rate'] = pinned.pool_hit_rate
+    finally:
+        pinned.dispose()
+
+    for name in ('default', 'pinned'):
+        print("{}: {:.0f} requests/s".format(
+            name, results[name]['requests_per_second']))
+
+    print("hit rate: {:.2f}, {} schema switches".format(
+        results['pinned']['hit_rate'],
+        results['pinned']['stats']['switches']
+    ))
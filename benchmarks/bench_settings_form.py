@@ -0,0 +1,72 @@
+""" Measures the allocations of the homepage settings form per request,
+before and after the form class was built once (instead of per request).
+
+Run with::
+
+    python benchmarks/bench_settings_form.py
+
+"""
+
+import time
+import tracemalloc
+
+from onegov.form import merge_forms, move_fields
+from onegov.org.forms import HomepageSettingsForm
+from onegov.town.views.settings import CustomFieldsForm
+from onegov.town.views.settings import get_custom_settings_form
+
+
+def legacy_settings_form():
+    """ Builds the form as it was before, on every request. """
+
+    form_class = move_fields(
+        form_class=merge_forms(HomepageSettingsForm, CustomFieldsForm),
+        fields=(
+            'online_counter_label',
+            'reservations_label',
+            'daypass_label',
+            'publications_label',
+            'hide_publications',
+        ),
+        after='homepage_image_6'
+    )
+
+    form = form_class()
+    form.delete_field('homepage_cover')
+    form.delete_field('homepage_structure')
+    form.delete_field('redirect_homepage_to')
+    form.delete_field('redirect_path')
+
+    return form
+
+
+def cached_settings_form():
+    return get_custom_settings_form(None, None)()
+
+
+def measure(name, fn, runs=1000):
+    fn()  # warm up
+
+    start = time.perf_counter()
+
+    for i in range(runs):
+        fn()
+
+    duration = (time.perf_counter() - start) / runs
+
+    # the peak memory allocated while handling a single request
+    peaks = []
+
+    for i in range(runs):
+        tracemalloc.start()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    print(f"{name}: {duration * 1000:.3f}ms, "
+          f"{sum(peaks) / runs / 1024:.1f}KiB allocated per request")
+
+
+if __name__ == '__main__':
+    measure('before', legacy_settings_form)
+    measure('after', cached_settings_form)
@@ -0,0 +1,45 @@
+import json
+import platform
+import pytest
+import sys
+import time
+
+from onegov.town.tests.conftest import forms, town_app, town_snapshot  # noqa
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('onegov.town benchmarks')
+    group.addoption(
+        '--benchmark-output', default='benchmark.json',
+        help="The file to which the results are written (JSON)")
+    group.addoption(
+        '--benchmark-runs', default=50, type=int,
+        help="The number of requests measured per view")
+    group.addoption(
+        '--benchmark-scale', default=1.0, type=float,
+        help="Multiplies the seeded data volumes")
+
+
+@pytest.fixture(scope='session')
+def benchmark_runs(request):
+    return request.config.getoption('--benchmark-runs')
+
+
+@pytest.fixture(scope='session')
+def benchmark_scale(request):
+    return request.config.getoption('--benchmark-scale')
+
+
+@pytest.yield_fixture(scope='session')
+def benchmark_results(request):
+    results = {}
+
+    yield results
+
+    with open(request.config.getoption('--benchmark-output'), 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'results': results
+        }, f, indent=2, sort_keys=True)
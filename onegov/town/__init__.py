@@ -5,6 +5,26 @@ log.addHandler(logging.NullHandler())  # noqa
 from translationstring import TranslationStringFactory  # noqa
 _ = TranslationStringFactory('onegov.town')  # noqa
 
-from onegov.town.app import TownApp  # noqa
+import sys  # noqa
 
 __all__ = ['_', 'log', 'TownApp']
+
+
+# The application pulls in all of onegov.org, so it is only imported once it
+# is used. This keeps modules which don't need it (e.g. the cli, the upgrade
+# tasks or the caches) fast to import. Python 3.6 doesn't support module
+# level __getattr__, so it's imported right away there.
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        if name == 'TownApp':
+            from onegov.town.app import TownApp
+            return TownApp
+
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(globals()) | {'TownApp'})
+
+else:
+    from onegov.town.app import TownApp  # noqa
@@ -7,11 +7,70 @@ use different templating languages.
 
 """
 
+import inspect
+import morepath
+import sedate
+import sqlalchemy
+
+from cached_property import cached_property
+from depot.manager import DepotManager
 from onegov.core import utils
+from onegov.core.i18n import default_locale_negotiator
+from onegov.core.orm import Base, orm_cached
+from onegov.file import File
 from onegov.org import OrgApp
 from onegov.org.app import get_i18n_localedirs as get_org_i18n_localedirs
+from onegov.org.models import Organisation, PublicationCollection
+from onegov.reservation import Resource, ResourceCollection
+from onegov.town.cache import snapshot_cached, TenantCache
+from onegov.town.daypasses import daypass_availability
+from onegov.town.homepage_cache import CachedResponse, HomepageCache
+from onegov.town.homepage_cache import HOMEPAGE_TABLES
+from onegov.town.homepage_template import homepage_templates
+from onegov.town.i18n import LazyChameleonTranslations, LazyTranslations
 from onegov.town.theme import TownTheme
 from onegov.town.initial_content import create_new_organisation
+from onegov.town.pool import SchemaPinnedSessionManager
+from onegov.town.request import TownRequest
+from onegov.town.search import BatchedIndexer, BatchedORMEventTranslator
+from onegov.town.widget_metrics import measure_widgets, WidgetMetrics
+
+
+LOCAL_FILE_STORAGE = 'depot.io.local.LocalFileStorage'
+
+
+def is_publication(obj):
+    """ Returns True if the given file is listed in the publications
+    (see :class:`onegov.org.models.PublicationCollection`).
+
+    """
+    if not (obj.published and obj.signed and obj.reference):
+        return False
+
+    return obj.reference.get('content_type') == 'application/pdf'
+
+
+def is_publication_change(obj):
+    """ Returns True if the given changed object might change the result
+    of :attr:`TownApp.has_publications`.
+
+    """
+    if not isinstance(obj, File):
+        return False
+
+    # objects deleted in bulk only carry their primary key
+    if obj.published is None:
+        return True
+
+    state = sqlalchemy.inspect(obj)
+
+    # new objects have no history, they are either a publication or not
+    if not state.pending:
+        for name in ('published', 'signed', 'reference'):
+            if state.attrs[name].history.has_changes():
+                return True
+
+    return is_publication(obj)
 
 
 class TownApp(OrgApp):
@@ -19,11 +78,405 @@ class TownApp(OrgApp):
     #: the version of this application (do not change manually!)
     version = '1.15.10'
 
+    request_class = TownRequest
+
+    #: caches the services panel shown on the homepage (per locale)
+    services_panel_cache = TenantCache('services-panel', tables=(
+        'organisations', 'resources', 'files', 'allocations', 'reserved_slots'
+    ))
+
+    #: caches the daypasses left per day (per resource, day and weeks)
+    daypass_cache = TenantCache(
+        'daypass-availability', tables=('allocations', 'reserved_slots'))
+
+    def configure_dsn(self, **cfg):
+        """ Uses a connection pool which keeps its connections pinned to
+        the schemas of the most recently used towns, if the
+        ``schema_pinned_pool`` option is given (see
+        :mod:`onegov.town.pool`).
+
+        """
+        config = cfg.get('schema_pinned_pool')
+
+        if not config or not cfg.get('dsn'):
+            return super().configure_dsn(**cfg)
+
+        # certain namespaces are reserved for internal use (as in core)
+        assert self.namespace not in {'global'}
+
+        config = config if isinstance(config, dict) else {}
+
+        self.dsn = cfg['dsn']
+        self.session_manager = SchemaPinnedSessionManager(
+            self.dsn, cfg.get('base', Base), **config)
+
     def configure_organisation(self, **cfg):
         cfg.setdefault('enable_user_registration', False)
         cfg.setdefault('enable_yubikey', True)
         super().configure_organisation(**cfg)
 
+    def configure_search(self, **cfg):
+        """ Indexes the changes of each transaction in bulk (see
+        :mod:`onegov.town.search`).
+
+        Accepts the ``elasticsearch_batch_size`` (100 by default) and the
+        ``elasticsearch_flush_interval`` (0 by default) options.
+
+        """
+        super().configure_search(**cfg)
+
+        if not self.es_client or not self.has_database_connection:
+            return
+
+        previous = self.es_orm_events
+
+        for signal in ('on_insert', 'on_update', 'on_delete'):
+            getattr(self.session_manager, signal).disconnect(
+                getattr(previous, signal))
+
+        self.es_orm_events = BatchedORMEventTranslator(
+            self.es_mappings,
+            max_queue_size=previous.queue.maxsize
+        )
+
+        self.es_indexer = BatchedIndexer(
+            self.es_mappings,
+            self.es_orm_events.queue,
+            es_client=self.es_client,
+            batch_size=int(cfg.get('elasticsearch_batch_size', 100)),
+            flush_interval=float(cfg.get('elasticsearch_flush_interval', 0))
+        )
+
+        self.es_orm_events.after_commit = self.es_indexer.process
+
+        self.session_manager.on_insert.connect(self.es_orm_events.on_insert)
+        self.session_manager.on_update.connect(self.es_orm_events.on_update)
+        self.session_manager.on_delete.connect(self.es_orm_events.on_delete)
+
+    def configure_file_deduplication(self, **cfg):
+        """ Stores identical files only once for all tenants, if the
+        ``deduplicate_files`` option is set (see
+        :class:`onegov.town.storage.DeduplicatingFileStorage`).
+
+        Only supported with the local file storage.
+
+        """
+        self.deduplicate_files = cfg.get('deduplicate_files', False)
+
+        if self.deduplicate_files:
+            assert cfg.get('depot_backend') == LOCAL_FILE_STORAGE, \
+                "File deduplication requires the local file storage"
+
+    def create_depot(self):
+        if not self.deduplicate_files:
+            return super().create_depot()
+
+        path = self.bound_storage_path
+
+        if not path.exists():
+            path.mkdir()
+
+        DepotManager.configure(self.bound_depot_id, {
+            'depot.backend': 'onegov.town.storage.DeduplicatingFileStorage',
+            'depot.storage_path': str(path)
+        })
+
+    def configure_homepage_cache(self, **cfg):
+        """ Enables the homepage cache for anonymous visitors, if the
+        ``homepage_cache`` option is given (see
+        :mod:`onegov.town.homepage_cache`).
+
+        """
+        config = cfg.get('homepage_cache')
+
+        if config:
+            config = config if isinstance(config, dict) else {}
+            self.homepage_cache = HomepageCache(**config)
+        else:
+            self.homepage_cache = None
+
+    def configure_widget_metrics(self, **cfg):
+        """ Measures the homepage widgets, if the ``widget_metrics``
+        option is set (see :mod:`onegov.town.widget_metrics`).
+
+        """
+        if cfg.get('widget_metrics', False):
+            self.widget_metrics = WidgetMetrics()
+            measure_widgets(self.config.homepage_widget_registry)
+        else:
+            self.widget_metrics = None
+
+    @property
+    def pool_stats(self):
+        """ The statistics of the schema pinned connection pool, or None if
+        it's not used.
+
+        """
+        manager = getattr(self, 'session_manager', None)
+
+        if not isinstance(manager, SchemaPinnedSessionManager):
+            return None
+
+        return dict(manager.pool_stats, hit_rate=manager.pool_hit_rate)
+
+    @property
+    def homepage_cache_backend(self):
+        """ The shared backend of the homepage cache, bound to the current
+        tenant. Override this to use a different backend.
+
+        """
+        if not self.homepage_cache or not self.homepage_cache.shared:
+            return None
+
+        return self.get_cache(
+            'homepage', expiration_time=self.homepage_cache.max_age)
+
+    @morepath.reify
+    def __call__(self):
+        fn = super().__call__
+
+        if getattr(self, 'homepage_cache', None):
+            fn = self.with_homepage_cache(fn)
+
+        return fn
+
+    def with_homepage_cache(self, fn):
+
+        def with_homepage_cache_wrapper(environ, start_response):
+            key = self.homepage_cache_key(environ)
+
+            if key is None:
+                return fn(environ, start_response)
+
+            backend = self.homepage_cache_backend
+            cached = self.homepage_cache.get(self.application_id, key, backend)
+
+            if cached is not None:
+                return cached(environ, start_response)
+
+            captured = {}
+
+            def capture_start_response(status, headers, exc_info=None):
+                captured['status'] = status
+                captured['headers'] = headers
+
+                return start_response(status, headers, exc_info)
+
+            result = fn(environ, capture_start_response)
+
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+            if captured and self.is_cacheable_homepage(**captured):
+                self.homepage_cache.set(
+                    self.application_id,
+                    key,
+                    CachedResponse(
+                        captured['status'], captured['headers'], body),
+                    backend
+                )
+
+            return [body]
+
+        return with_homepage_cache_wrapper
+
+    def homepage_cache_key(self, environ):
+        """ Returns the key under which the homepage is cached for the
+        given environ, or None if the request may not be cached.
+
+        Only anonymous visitors are served from the cache. As the identity
+        is stored in the browser session, every request with a browser
+        session is considered to be possibly logged in.
+
+        """
+        if environ['REQUEST_METHOD'] != 'GET':
+            return None
+
+        if environ.get('PATH_INFO', '/') not in ('', '/'):
+            return None
+
+        if environ.get('QUERY_STRING'):
+            return None
+
+        request = self.request_class(environ, app=self)
+
+        if 'session_id' in request.cookies:
+            return None
+
+        locale = default_locale_negotiator(self.locales, request) \
+            or self.default_locale
+
+        # the links are absolute, so the page differs per virtual host
+        return f'{request.virtual_base_url}:{locale}'
+
+    def is_cacheable_homepage(self, status, headers):
+        if not status.startswith('200'):
+            return False
+
+        for name, value in headers:
+            name = name.lower()
+
+            if name == 'set-cookie':
+                return False
+
+            if name == 'content-type' and not value.startswith('text/html'):
+                return False
+
+        return True
+
+    def setup_orm_cache(self):
+        super().setup_orm_cache()
+
+        for descriptor in self.tenant_cache_descriptors:
+            handler = descriptor.change_handler(self)
+
+            self.session_manager.on_insert.connect(handler, weak=False)
+            self.session_manager.on_update.connect(handler, weak=False)
+            self.session_manager.on_delete.connect(handler, weak=False)
+
+        handler = self.handle_homepage_cache_change
+
+        self.session_manager.on_insert.connect(handler, weak=False)
+        self.session_manager.on_update.connect(handler, weak=False)
+        self.session_manager.on_delete.connect(handler, weak=False)
+
+    def handle_homepage_cache_change(self, schema, obj):
+        if not getattr(self, 'homepage_cache', None):
+            return
+
+        if getattr(obj.__class__, '__tablename__', None) in HOMEPAGE_TABLES:
+            assert self.schema == schema
+
+            self.homepage_cache.invalidate(
+                self.application_id, self.homepage_cache_backend)
+
+    @cached_property
+    def translations(self):
+        """ Returns all available translations keyed by language. The
+        translations are precompiled and loaded on first use (see
+        :mod:`onegov.town.i18n`).
+
+        """
+        return LazyTranslations(self.settings.i18n.localedirs)
+
+    @cached_property
+    def chameleon_translations(self):
+        return LazyChameleonTranslations(self.translations)
+
+    @cached_property
+    def class_links(self):
+        """ The links to classes without variables, resolved once per
+        application base path (see :meth:`TownRequest.class_link`).
+
+        """
+        return {}
+
+    @property
+    def homepage_template(self):
+        """ Returns the compiled homepage template, shared with all other
+        tenants using the same homepage structure (see
+        :mod:`onegov.town.homepage_template`).
+
+        """
+        return homepage_templates.get(
+            self, self.org.meta.get('homepage_structure'))
+
+    @snapshot_cached(policy='on-table-change:organisations')
+    def org(self):
+        """ The organisation, which is read by nearly every view. Unlike
+        onegov.org, it's kept in the process and only loaded again if it
+        changes (see :class:`onegov.town.cache.SnapshotCacheDescriptor`).
+
+        """
+        return self.session().query(Organisation).first()
+
+    @orm_cached(policy=is_publication_change)
+    def has_publications(self):
+        """ True if there's at least one publication.
+
+        Unlike :attr:`publications_count`, this is not evicted by every
+        change to the files table (e.g. an uploaded image), but only by
+        changes which might affect the publications.
+
+        """
+        query = PublicationCollection(self.session()).query()
+        return self.session().query(query.exists()).scalar()
+
+    @orm_cached(policy='on-table-change:resources')
+    def resource_ids_by_name(self):
+        query = ResourceCollection(self.libres_context).query()
+        query = query.with_entities(Resource.name, Resource.id)
+
+        return dict(query)
+
+    @orm_cached(policy='on-table-change:resources')
+    def resource_timezones_by_name(self):
+        query = ResourceCollection(self.libres_context).query()
+        query = query.with_entities(Resource.name, Resource.timezone)
+
+        return dict(query)
+
+    def resources_by_name(self, names):
+        """ Returns the resources with the given names, in the order of the
+        given names. Names without resource are skipped.
+
+        Uses a single query at most, as the names are resolved through
+        :attr:`resource_ids_by_name`.
+
+        """
+
+        index = self.resource_ids_by_name
+        ids = [index[name] for name in names if name in index]
+
+        if not ids:
+            return []
+
+        resources = ResourceCollection(self.libres_context)
+        query = resources.query().filter(Resource.id.in_(ids))
+
+        by_id = {r.id: resources.bind(r) for r in query}
+        return [by_id[id] for id in ids if id in by_id]
+
+    def daypass_availability(self, resource, weeks=4):
+        """ Returns the number of daypasses left per day of the given
+        resource, starting today, for the given number of weeks (see
+        :func:`onegov.town.daypasses.daypass_availability`).
+
+        The summary is cached until an allocation or a reservation changes.
+
+        """
+        today = self.daypass_today(resource)
+        key = (resource.id.hex, today.isoformat(), weeks)
+
+        return self.daypass_cache.get_or_create(key, creator=lambda: (
+            daypass_availability(self.session(), resource, today, weeks)
+        ))
+
+    def daypasses_left_today(self, resource):
+        """ Returns the number of daypasses left today, or None if there
+        are no daypasses today.
+
+        """
+        availability = self.daypass_availability(resource)
+        return availability.get(self.daypass_today(resource))
+
+    def daypass_today(self, resource):
+        return self.today_in(resource.timezone)
+
+    def today_in(self, timezone):
+        return sedate.to_timezone(sedate.utcnow(), timezone).date()
+
+    @property
+    def tenant_cache_descriptors(self):
+        """ Yields all tenant caches installed on the class. """
+
+        for member_name, member in inspect.getmembers(self.__class__):
+            if isinstance(member, TenantCache):
+                yield member
+
 
 @TownApp.static_directory()
 def get_static_directory():
@@ -0,0 +1,226 @@
+""" Serves the static files and the compiled themes, so browsers may keep
+them for a long time and only revalidate them cheaply.
+
+* The links to static files carry a hash of their content, instead of the
+  version of the application (see :meth:`TownRequest.link`). A release
+  therefore only changes the links of the files which actually changed.
+* Files with a matching hash in their link and the themes (whose filename
+  already depends on their sources and options) are cached for a year.
+* All responses carry an ETag. Browsers revalidating a file receive a 304
+  reply without a body.
+* If a precompressed variant of a file exists (``.br`` or ``.gz``), it's
+  sent to browsers accepting it.
+
+The precompressed variants are created during the deployment::
+
+    onegov-town --select '/onegov_town/*' compress-assets
+
+Brotli variants are only created if the ``brotli`` package is installed.
+
+"""
+
+import gzip
+import hashlib
+import magic
+import mimetypes
+import os
+
+from collections import OrderedDict
+from onegov.core.cache import lru_cache
+from webob.static import FileApp
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+#: the precompressed variants by content encoding, in order of preference
+ENCODINGS = OrderedDict((
+    ('br', '.br'),
+    ('gzip', '.gz'),
+))
+
+#: the extensions of files worth compressing (images and fonts like woff
+#: are compressed already)
+COMPRESSIBLE = frozenset((
+    '.css', '.eot', '.html', '.js', '.json', '.map', '.otf', '.svg', '.ttf',
+    '.txt', '.xml'
+))
+
+#: files smaller than this are not compressed
+MIN_SIZE = 1024
+
+#: the cache control of files whose links change with their content
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+#: the cache control of all other files, which have to be revalidated
+REVALIDATE = 'public, no-cache'
+
+
+@lru_cache(maxsize=4096)
+def content_hash(path, mtime, size):
+    """ Returns the hash of the given file, read once per modification. """
+
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()[:16]
+
+
+def fingerprint(path):
+    """ Returns a short hash of the content of the given file. """
+
+    stat = os.stat(path)
+    return content_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+def find_static_file(app, path):
+    """ Returns the absolute path of the given static file (relative to
+    the static directories of the given application), or None.
+
+    """
+
+    for directory in app.static_files:
+        candidate = os.path.join(directory, path)
+
+        if os.path.isfile(candidate):
+            return candidate
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+
+    return gzip.compress(data, compresslevel=9)
+
+
+def available_encodings():
+    return [e for e in ENCODINGS if e != 'br' or brotli is not None]
+
+
+def is_compressible(path):
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE
+
+
+def is_fresh(variant, path):
+    """ Returns True if the given variant exists and is not older than the
+    given file.
+
+    """
+    try:
+        return os.stat(variant).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def compress_file(path, force=False):
+    """ Writes the precompressed variants of the given file, unless they
+    exist already. Returns the paths of the written variants.
+
+    Variants which are not smaller than the file itself are not written.
+
+    """
+
+    if not is_compressible(path) or os.path.getsize(path) < MIN_SIZE:
+        return []
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    written = []
+
+    for encoding in available_encodings():
+        variant = path + ENCODINGS[encoding]
+
+        if not force and is_fresh(variant, path):
+            continue
+
+        compressed = compress(data, encoding)
+
+        if len(compressed) >= len(data):
+            continue
+
+        # write atomically, as the file might be served at the same time
+        temporary = f'{variant}.{os.getpid()}.tmp'
+
+        with open(temporary, 'wb') as f:
+            f.write(compressed)
+
+        os.replace(temporary, variant)
+        written.append(variant)
+
+    return written
+
+
+def compress_directory(directory, force=False):
+    """ Writes the precompressed variants of all files in the given
+    directory (recursively). Yields the paths of the written variants.
+
+    """
+
+    for root, dirs, files in os.walk(directory):
+        for filename in sorted(files):
+            yield from compress_file(os.path.join(root, filename), force)
+
+
+def accepted_encodings(request):
+    """ Returns the encodings of the precompressed variants accepted by the
+    given request, in order of preference.
+
+    Clients without an Accept-Encoding header only receive the file itself.
+
+    """
+    if 'Accept-Encoding' not in request.headers:
+        return []
+
+    offers = request.accept_encoding.acceptable_offers(list(ENCODINGS))
+    return [encoding for encoding, quality in offers]
+
+
+def select_variant(path, encodings):
+    """ Returns the path and the content encoding of the first fresh
+    variant of the given file, out of the given encodings.
+
+    """
+
+    for encoding in encodings:
+        variant = path + ENCODINGS[encoding]
+
+        if is_fresh(variant, path):
+            return variant, encoding
+
+    return path, None
+
+
+def get_content_type(path):
+    return mimetypes.guess_type(path)[0] or magic.from_file(path, mime=True)
+
+
+def serve_file(request, path, immutable=False):
+    """ Returns the response for the given file, using the best
+    precompressed variant for the request.
+
+    The ETag depends on the content and the encoding. A matching
+    If-None-Match header results in a 304 reply.
+
+    """
+
+    variant, encoding = select_variant(path, accepted_encodings(request))
+
+    etag = fingerprint(path)
+
+    if encoding:
+        etag = f'{etag}-{encoding}'
+
+    return request.get_response(FileApp(
+        variant,
+        content_type=get_content_type(path),
+        content_encoding=encoding,
+        etag=etag,
+        cache_control=IMMUTABLE if immutable else REVALIDATE,
+        vary=('Accept-Encoding', ) if is_compressible(path) else None
+    ))
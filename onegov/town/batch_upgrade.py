@@ -0,0 +1,177 @@
+""" Runs the upgrade tasks of many towns in parallel, using a pool of
+processes (see :func:`run_batched_upgrade`).
+
+Unlike the upgrade runner of :mod:`onegov.core.upgrade`, which commits after
+each task and disposes of the database engine in between, each worker runs
+all pending tasks of a town in a single transaction, reusing its connection
+for all the towns in its batches.
+
+Since the executed tasks are stored in the database together with the
+changes, an interrupted upgrade can be resumed by running it again. Towns
+which were already upgraded only cost a single query.
+
+"""
+
+import time
+
+from collections import namedtuple
+from multiprocessing import Pool
+from onegov.core.upgrade import get_tasks, get_upgrade_modules
+from onegov.core.upgrade import register_modules
+from onegov.core.upgrade import UpgradeContext, UpgradeState
+from onegov.core.utils import chunks, scan_morepath_modules
+
+
+#: the outcome of upgrading a single town
+UpgradeResult = namedtuple(
+    'UpgradeResult', ('application_id', 'tasks', 'duration', 'error'))
+
+
+def run_batched_upgrade(app_class, namespace, configuration, application_ids,
+                        processes=None, batch_size=10, commit=True):
+    """ Runs all pending upgrade tasks of the given applications, using a
+    pool of processes. Yields an :class:`UpgradeResult` for each
+    application, as soon as its batch is done.
+
+    Raw upgrade tasks are not run, they have to be run beforehand (see
+    :class:`onegov.core.upgrade.RawUpgradeRunner`).
+
+    :param app_class:
+        The application class (e.g. :class:`onegov.town.TownApp`).
+
+    :param namespace:
+        The namespace of the application (e.g. 'onegov_town').
+
+    :param configuration:
+        The configuration passed to the application.
+
+    :param application_ids:
+        The application ids to upgrade (including the namespace).
+
+    :param batch_size:
+        The number of applications handed to a worker at once. Each
+        application is still upgraded (and committed) on its own.
+
+    :param commit:
+        False if the changes should be rolled back (dry-run).
+
+    """
+
+    batches = (
+        tuple(id for id in batch if id is not None)
+        for batch in chunks(application_ids, batch_size)
+    )
+
+    initargs = (app_class, namespace, configuration, commit)
+
+    with Pool(processes, initializer=setup_worker, initargs=initargs) as pool:
+        for results in pool.imap_unordered(upgrade_batch, batches):
+            yield from results
+
+
+#: the application instance of an upgrade worker process
+worker_app = None
+
+#: the upgrade modules and the basic upgrade tasks of the worker process
+worker_modules = None
+worker_tasks = None
+
+#: True if the upgrade worker commits its changes
+worker_commit = True
+
+
+def setup_worker(app_class, namespace, configuration, commit):
+    """ Sets up the application instance of an upgrade worker process. """
+
+    global worker_app, worker_modules, worker_tasks, worker_commit
+
+    scan_morepath_modules(app_class)
+    app_class.commit()
+
+    worker_app = app_class()
+    worker_app.namespace = namespace
+    worker_app.configure_application(**configuration)
+
+    worker_modules = list(get_upgrade_modules())
+    worker_tasks = tuple((i, t) for i, t in get_tasks() if not t.raw)
+    worker_commit = commit
+
+
+def upgrade_batch(application_ids):
+    """ Upgrades a batch of applications, used by
+    :func:`run_batched_upgrade`.
+
+    """
+    return [upgrade_application(id) for id in application_ids]
+
+
+def upgrade_application(application_id):
+    """ Runs all pending upgrade tasks of a single application in a single
+    transaction.
+
+    Errors are not raised, but returned as part of the result, so a single
+    town does not stop the upgrade of the others.
+
+    """
+
+    start = time.perf_counter()
+    executed = []
+
+    try:
+        # a town with a broken schema or configuration fails on its own
+        worker_app.set_application_id(application_id)
+        worker_app.clear_request_cache()
+
+        request = worker_app.request_class(environ={
+            'PATH_INFO': '/',
+            'SERVER_NAME': '',
+            'SERVER_PORT': '',
+            'SERVER_PROTOCOL': 'https'
+        }, app=worker_app)
+
+        context = UpgradeContext(request)
+        upgrade = context.begin()
+
+        try:
+            register_modules(context.session, worker_modules, worker_tasks)
+
+            states = {
+                state.module: state
+                for state in context.session.query(UpgradeState)
+            }
+
+            for task_id, task in worker_tasks:
+                state = states[task_id.split(':')[0]]
+
+                if not task.always_run and state.was_already_executed(task):
+                    continue
+
+                result = task(context)
+
+                # mark all tasks as executed, even 'always run' ones
+                state.mark_as_executed(task)
+                upgrade.flush()
+
+                # always-run tasks which return False are considered
+                # to have not run
+                if not (task.always_run and result is False):
+                    executed.append(task.task_name)
+
+        except Exception:
+            upgrade.abort()
+            context.session.invalidate()
+            raise
+        else:
+            if worker_commit:
+                upgrade.commit()
+            else:
+                upgrade.abort()
+
+    except Exception as e:
+        error = f'{e.__class__.__name__}: {e}'
+    else:
+        error = None
+
+    duration = time.perf_counter() - start
+
+    return UpgradeResult(application_id, tuple(executed), duration, error)
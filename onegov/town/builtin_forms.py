@@ -0,0 +1,155 @@
+""" Provides the builtin forms of onegov.town, precompiled into a cache file
+stored next to the form files (``forms/builtin/<lang>/forms.json``).
+
+The cache file contains the title and the definition of each form and
+whether it has a required e-mail field, keyed by the hash of the form file.
+If a form file changes, the form is parsed again and the cache file is
+rewritten (atomically, as multiple processes might do so at the same time).
+
+To precompile the forms (e.g. before building a release), run::
+
+    python -m onegov.town.builtin_forms
+
+"""
+
+import hashlib
+import json
+import os
+
+from onegov.core.cache import lru_cache
+from onegov.core.utils import module_path, rchop
+from onegov.form import parse_form
+from onegov.town import log
+
+
+#: the builtin forms of each locale
+FORM_PATHS = {
+    'de_CH': 'forms/builtin/de',
+    'fr_CH': 'forms/builtin/fr',
+}
+
+#: the name of the cache file inside each directory
+CACHE_FILE = 'forms.json'
+
+#: increment if the format of the cache changes
+CACHE_VERSION = 2
+
+
+class BuiltinForm(object):
+    """ A precompiled builtin form. """
+
+    __slots__ = ('name', 'hash', 'title', 'definition',
+                 'has_required_email_field')
+
+    def __init__(self, name, hash, title, definition,
+                 has_required_email_field):
+        self.name = name
+        self.hash = hash
+        self.title = title
+        self.definition = definition
+        self.has_required_email_field = has_required_email_field
+
+    @classmethod
+    def compile(cls, name, hash, source):
+        """ Parses the form source (the title, followed by two lines which
+        are ignored and the form definition).
+
+        """
+        lines = source.splitlines(keepends=True)
+
+        title = lines[0].strip()
+        definition = ''.join(lines[3:])
+
+        has_required_email_field = parse_form(definition)()\
+            .has_required_email_field
+
+        return cls(name, hash, title, definition, has_required_email_field)
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+def load_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+
+    return {
+        name: BuiltinForm(**form) for name, form in cache['forms'].items()
+    }
+
+
+def write_cache(path, forms):
+    cache = {
+        'version': CACHE_VERSION,
+        'forms': {form.name: form.as_dict() for form in forms}
+    }
+
+    # other processes might read or write the cache at the same time
+    temporary = f'{path}.{os.getpid()}.tmp'
+
+    try:
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+        os.replace(temporary, path)
+    except OSError:
+        # the package might be installed read-only, in which case we parse
+        # the forms once per process
+        log.warning(f"Could not write the form cache to {path}")
+
+
+def compile_builtin_forms(directory):
+    """ Returns the builtin forms in the given directory, using the cache
+    file if it is up to date. Stale or missing entries are parsed and
+    written back to the cache file.
+
+    """
+    cache_path = os.path.join(directory, CACHE_FILE)
+    cache = load_cache(cache_path)
+
+    forms = []
+    stale = False
+
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.form'):
+            continue
+
+        with open(os.path.join(directory, filename), 'rb') as f:
+            source = f.read()
+
+        name = rchop(filename, '.form')
+        hash = hashlib.sha1(source).hexdigest()
+
+        form = cache.get(name)
+
+        if not form or form.hash != hash:
+            form = BuiltinForm.compile(name, hash, source.decode('utf-8'))
+            stale = True
+
+        forms.append(form)
+
+    if stale or len(forms) != len(cache):
+        write_cache(cache_path, forms)
+
+    return tuple(forms)
+
+
+@lru_cache(maxsize=len(FORM_PATHS))
+def builtin_forms(locale):
+    """ Returns the precompiled builtin forms of the given locale. The cache
+    is only read once per process.
+
+    """
+    path = module_path('onegov.town', FORM_PATHS[locale])
+    return compile_builtin_forms(path)
+
+
+if __name__ == '__main__':
+    for locale in FORM_PATHS:
+        print(f"{locale}: {len(builtin_forms(locale))} forms")
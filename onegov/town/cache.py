@@ -0,0 +1,208 @@
+""" Provides per-tenant caches for computed values which are too specific
+for :func:`onegov.core.orm.orm_cached`.
+
+Unlike orm cached properties, these caches store several entries (e.g. one
+per locale) and are evicted as a whole if any of the given tables change::
+
+    class App(TownApp):
+
+        panel_cache = TenantCache('panel', tables=('organisations', ))
+
+    app.panel_cache.get_or_create(key, creator=lambda: ...)
+
+The entries are kept in the application cache, which is bound to the
+current application id, so there's no way for tenants to see each other's
+values.
+
+Objects which are read on every request (e.g. the organisation) are kept in
+the process instead, see :func:`snapshot_cached`.
+
+"""
+
+import pickle
+
+from collections import Counter
+from copy import deepcopy
+from dogpile.cache.api import NO_VALUE
+from onegov.core.orm.cache import OrmCacheDescriptor
+from sqlalchemy import inspect
+from sqlalchemy.orm.attributes import set_committed_value
+from uuid import uuid4
+
+
+class TenantCache(object):
+    """ Describes a cache on the application class. Accessing it through
+    the application instance returns a :class:`BoundTenantCache`.
+
+    """
+
+    def __init__(self, name, tables):
+        self.name = name
+        self.tables = frozenset(tables)
+
+        #: hits, misses and invalidations of this process
+        self.stats = Counter(hits=0, misses=0, invalidations=0)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return BoundTenantCache(self, instance)
+
+    def change_handler(self, app):
+        """ Returns a signal handler which evicts the cache if one of the
+        observed tables is changed.
+
+        """
+
+        def handle_orm_change(schema, obj):
+            tablename = getattr(obj.__class__, '__tablename__', None)
+
+            if tablename in self.tables:
+                assert app.schema == schema
+                self.__get__(app, app.__class__).invalidate()
+
+        return handle_orm_change
+
+
+class BoundTenantCache(object):
+    """ A :class:`TenantCache` bound to an application instance. """
+
+    def __init__(self, descriptor, app):
+        self.descriptor = descriptor
+        self.app = app
+
+    @property
+    def stats(self):
+        return self.descriptor.stats
+
+    @property
+    def cache_key(self):
+        return self.descriptor.name
+
+    def get_or_create(self, key, creator):
+        """ Returns the entry stored under the given key, or creates it
+        using the given creator.
+
+        """
+
+        # make sure pending changes are seen before we access the cache
+        # (see :meth:`onegov.core.orm.cache.OrmCacheDescriptor.load`)
+        session = self.app.session()
+
+        if session.dirty:
+            session.flush()
+
+        entries = self.app.cache.get(self.cache_key)
+
+        if entries is NO_VALUE:
+            entries = {}
+
+        if key in entries:
+            self.stats['hits'] += 1
+            return entries[key]
+
+        self.stats['misses'] += 1
+
+        entries[key] = value = creator()
+        self.app.cache.set(self.cache_key, entries)
+
+        return value
+
+    def invalidate(self):
+        self.stats['invalidations'] += 1
+        self.app.cache.delete(self.cache_key)
+
+
+class SnapshotCacheDescriptor(OrmCacheDescriptor):
+    """ Like :func:`onegov.core.orm.orm_cached`, but the object is kept in
+    the process, per tenant, as a detached snapshot. Only the version of the
+    snapshot is stored in the application cache.
+
+    The version is evicted by the cache policy, like an orm cached object.
+    The snapshot is then loaded again by each process, the next time it is
+    accessed. Otherwise it is merged into the session without querying or
+    deserializing it.
+
+    """
+
+    def __init__(self, cache_policy, creator):
+        super().__init__(cache_policy, creator)
+
+        #: the version and the snapshot by application id
+        self.snapshots = {}
+
+        #: hits and misses of this process
+        self.stats = Counter(hits=0, misses=0)
+
+    def snapshot(self, app):
+        """ Returns the snapshot of the current tenant, loading it if its
+        version has changed.
+
+        """
+
+        version = app.cache.get_or_create(
+            key=self.cache_key,
+            creator=lambda: uuid4().hex
+        )
+
+        snapshot = self.snapshots.get(app.application_id)
+
+        if snapshot and snapshot[0] == version:
+            self.stats['hits'] += 1
+            return snapshot[1]
+
+        self.stats['misses'] += 1
+
+        # the snapshot is a detached copy, the loaded object stays in the
+        # session, as it might have been loaded by a query before
+        obj = pickle.loads(pickle.dumps(self.create(app)))
+
+        self.snapshots[app.application_id] = (version, obj)
+
+        return obj
+
+    def load(self, app):
+        session = app.session()
+
+        # see :meth:`onegov.core.orm.cache.OrmCacheDescriptor.load`
+        if session.dirty:
+            session.flush()
+
+        if self.cache_key in app.request_cache:
+            return self.merge(session, app.request_cache[self.cache_key])
+
+        obj = self.snapshot(app)
+
+        if obj is not None:
+            obj = self.merge(session, obj)
+
+            # the snapshot is shared by all requests, changes to its mutable
+            # values (e.g. the meta dictionary) must not end up in it
+            for attr in inspect(obj).mapper.column_attrs:
+                value = obj.__dict__.get(attr.key)
+
+                if isinstance(value, (dict, list)):
+                    set_committed_value(obj, attr.key, deepcopy(value))
+
+        app.request_cache[self.cache_key] = obj
+
+        return obj
+
+
+def snapshot_cached(policy):
+    """ Defines a property on the application class which is cached per
+    process and tenant (see :class:`SnapshotCacheDescriptor`)::
+
+        class App(TownApp):
+
+            @snapshot_cached(policy='on-table-change:organisations')
+            def org(self):
+                return self.session().query(Organisation).first()
+
+    """
+
+    def snapshot_cache_decorator(fn):
+        return SnapshotCacheDescriptor(policy, fn)
+
+    return snapshot_cache_decorator
@@ -0,0 +1,496 @@
+""" Provides commands used to manage town websites. Includes all commands
+provided by :mod:`onegov.org.cli`.
+
+Modules which import onegov.org (including the application) are only
+imported by the commands which need them, so the cli starts quickly.
+
+"""
+
+import click
+import json
+import time
+
+from onegov.core.cli import command_group, pass_group_context, abort
+from onegov.core.upgrade import get_tasks, RawUpgradeRunner
+from onegov.core.utils import groupbylist, scan_morepath_modules
+from onegov.town.batch_upgrade import run_batched_upgrade
+from onegov.town.import_time import DEFAULT_MODULES, profile, total_time
+from onegov.town.prewarm import prewarm_applications
+
+
+def org_commands():
+    """ Returns the commands of :mod:`onegov.org.cli`. """
+
+    from onegov.org.cli import cli as org_cli
+    return org_cli.commands
+
+
+class TownCommands(dict):
+    """ The commands of onegov.town, falling back to the commands of
+    onegov.org, which are only imported if one of them is looked up.
+
+    onegov.core looks up the invoked command directly in the commands of the
+    group, so the commands of onegov.org have to be found there as well.
+
+    """
+
+    def __missing__(self, name):
+        return org_commands()[name]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+class TownCommandGroup(click.Group):
+    """ Includes the commands of onegov.org, which are only imported if
+    one of them is run (or if the commands are listed).
+
+    The commands of onegov.town take precedence.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = TownCommands(self.commands)
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(org_commands()))
+
+
+def town_command_group():
+    """ Returns the command group of onegov.core as a
+    :class:`TownCommandGroup`.
+
+    """
+    group = command_group()
+
+    return TownCommandGroup(
+        name=group.name,
+        commands=group.commands,
+        callback=group.callback,
+        params=group.params,
+        context_settings=group.context_settings,
+        invoke_without_command=group.invoke_without_command,
+        result_callback=group.result_callback
+    )
+
+
+cli = town_command_group()
+
+
+def selected_applications(group_context):
+    """ Yields the config of each selected, database bound application,
+    together with the selected application ids.
+
+    """
+    matches = groupbylist(
+        sorted(group_context.matches),
+        key=lambda match: group_context.match_to_appcfg(match).namespace
+    )
+
+    for namespace, selected in matches:
+        appcfg = group_context.match_to_appcfg(selected[0])
+
+        if 'dsn' in appcfg.configuration:
+            yield appcfg, [match.lstrip('/') for match in selected]
+
+
+def validate_event_file(ctx, param, value):
+    """ Ensures the format of the given event file is supported. """
+
+    from onegov.town.event_import import get_event_reader
+
+    if value is not None:
+        try:
+            get_event_reader(value)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+
+    return value
+
+
+def create_application(appcfg):
+    """ Returns a configured application instance, for commands which do
+    not need a request.
+
+    """
+    scan_morepath_modules(appcfg.application_class)
+    appcfg.application_class.commit()
+
+    app = appcfg.application_class()
+    app.namespace = appcfg.namespace
+    app.configure_application(**appcfg.configuration)
+
+    return app
+
+
+@cli.command(name='add-many', context_settings={'matches_required': False})
+@click.argument('towns', nargs=-1, required=True)
+@click.option('--locale',
+              default='de_CH', type=click.Choice(['de_CH', 'fr_CH']))
+@click.option('--processes', default=None, type=int,
+              help="Number of worker processes (defaults to the cpu count)")
+@click.option('--create-files/--no-create-files', default=True,
+              help="Create the initial images and files")
+@click.option('--events', default=None,
+              type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+              callback=validate_event_file,
+              help="A YAML, CSV or iCalendar file with events to import")
+@pass_group_context
+def add_many(group_context, towns, locale, processes, create_files, events):
+    """ Adds many towns at once, using multiple processes. The towns are
+    given as id=name pairs, the selector only includes the namespace.
+    For example:
+
+        onegov-town --select '/onegov_town' add-many \\
+            govikon=Govikon gemeinde-x="Gemeinde X"
+
+    """
+
+    appcfgs = tuple(group_context.appcfgs)
+
+    if len(appcfgs) != 1:
+        abort("The selector must match a single namespace, aborting.")
+
+    appcfg = appcfgs[0]
+
+    if not all('=' in town for town in towns):
+        abort("Towns must be given as id=name pairs, aborting.")
+
+    towns = dict(town.split('=', 1) for town in towns)
+
+    from onegov.town.initial_content import create_new_organisations
+
+    results = create_new_organisations(
+        app_class=appcfg.application_class,
+        namespace=appcfg.namespace,
+        configuration=appcfg.configuration,
+        towns=towns,
+        locale=locale,
+        create_files=create_files,
+        processes=processes,
+        events=events
+    )
+
+    failed = 0
+
+    for result in results:
+        if result.error:
+            failed += 1
+            click.secho("{} failed after {:.2f}s: {}".format(
+                result.application_id, result.duration, result.error
+            ), fg='red')
+        else:
+            click.secho("{} was created successfully in {:.2f}s".format(
+                result.application_id, result.duration
+            ), fg='green')
+
+    if failed:
+        abort("{} of {} towns could not be created".format(
+            failed, len(towns)))
+
+
+@cli.command(name='import-events', context_settings={'singular': True})
+@click.argument('path', callback=validate_event_file, type=click.Path(
+    exists=True, dir_okay=False, resolve_path=True))
+@click.option('--batch-size', default=500, type=int,
+              help="Number of events inserted at once")
+def import_events_command(path, batch_size):
+    """ Imports the events of a YAML, CSV or iCalendar file into a
+    single town, as published events. For example:
+
+        onegov-town --select '/onegov_town/govikon' import-events events.csv
+
+    The events are read and inserted in batches, so large files may be
+    imported. Run 'onegov-search reindex' afterwards.
+
+    """
+
+    from onegov.town.event_import import import_events, read_events
+
+    def run_import(request, app):
+        start = time.perf_counter()
+
+        events, occurrences = import_events(
+            app.session(), read_events(path), batch_size)
+
+        duration = time.perf_counter() - start
+
+        click.secho(
+            f"Imported {events} events with {occurrences} occurrences "
+            f"in {duration:.2f}s", fg='green')
+
+    return run_import
+
+
+@cli.command(name='batch-upgrade', context_settings={'default_selector': '*'})
+@click.option('--processes', default=None, type=int,
+              help="Number of worker processes (defaults to the cpu count)")
+@click.option('--batch-size', default=10, type=int,
+              help="Number of towns handed to a worker at once")
+@click.option('--dry-run', default=False, is_flag=True,
+              help="Do not commit the changes")
+@pass_group_context
+def batch_upgrade(group_context, processes, batch_size, dry_run):
+    """ Upgrades many towns in parallel, running all pending upgrade tasks
+    of a town in a single transaction.
+
+    If the upgrade is interrupted, run it again to resume it. Towns which
+    were already upgraded are skipped.
+
+    """
+
+    raw_tasks = tuple((id, task) for id, task in get_tasks() if task.raw)
+
+    failed = 0
+    total = 0
+
+    for appcfg, application_ids in selected_applications(group_context):
+        namespace = appcfg.namespace
+
+        click.secho(f"Upgrading {len(application_ids)} applications "
+                    f"of {namespace}", underline=True)
+
+        if raw_tasks:
+            RawUpgradeRunner(
+                tasks=raw_tasks,
+                commit=not dry_run,
+                on_task_success=lambda task: click.secho(
+                    f"* {task.task_name}", fg='green'),
+                on_task_fail=lambda task: click.secho(
+                    f"* {task.task_name}", fg='red')
+            ).run_upgrade(
+                appcfg.configuration['dsn'],
+                [id.replace('/', '-') for id in application_ids]
+            )
+
+        results = run_batched_upgrade(
+            app_class=appcfg.application_class,
+            namespace=namespace,
+            configuration=appcfg.configuration,
+            application_ids=application_ids,
+            processes=processes,
+            batch_size=batch_size,
+            commit=not dry_run
+        )
+
+        duration = 0
+
+        for ix, result in enumerate(results, start=1):
+            total += 1
+            duration += result.duration
+
+            progress = f"[{ix}/{len(application_ids)}]"
+
+            if result.error:
+                failed += 1
+                click.secho("{} {} failed after {:.2f}s: {}".format(
+                    progress, result.application_id, result.duration,
+                    result.error
+                ), fg='red')
+            else:
+                click.secho("{} {} executed {} tasks in {:.2f}s".format(
+                    progress, result.application_id, len(result.tasks),
+                    result.duration
+                ), fg='green' if result.tasks else None)
+
+                for task in result.tasks:
+                    click.echo(f"  * {task}")
+
+        if application_ids:
+            click.echo("{:.2f}s spent upgrading, {:.2f}s on average".format(
+                duration, duration / len(application_ids)))
+
+    if failed:
+        abort(f"{failed} of {total} applications could not be upgraded")
+
+
+@cli.command(name='compile-themes', context_settings={'default_selector': '*'})
+@click.option('--processes', default=None, type=int,
+              help="Number of worker processes (defaults to the cpu count)")
+@click.option('--force', default=False, is_flag=True,
+              help="Compile themes which already exist")
+@pass_group_context
+def compile_themes(group_context, processes, force):
+    """ Compiles the themes of the selected towns in parallel, so the first
+    request after a release doesn't have to.
+
+    Towns with the same theme options share a single theme.
+
+    """
+
+    from onegov.town.theme.precompile import precompile_themes
+
+    failed = 0
+
+    for appcfg, application_ids in selected_applications(group_context):
+        app = create_application(appcfg)
+
+        if not app.settings.core.theme:
+            continue
+
+        click.secho(f"Compiling the themes of {len(application_ids)} "
+                    f"applications of {appcfg.namespace}", underline=True)
+
+        results = precompile_themes(app, application_ids, processes, force)
+        compiled = 0
+
+        for result in results:
+            towns = ', '.join(result.application_ids)
+
+            if result.error:
+                failed += 1
+                click.secho("{} failed after {:.2f}s ({}): {}".format(
+                    result.filename, result.duration, towns, result.error
+                ), fg='red')
+            else:
+                compiled += 1
+                click.secho("{} compiled in {:.2f}s ({})".format(
+                    result.filename, result.duration, towns
+                ), fg='green')
+
+        click.echo(f"{compiled} themes compiled")
+
+    if failed:
+        abort(f"{failed} themes could not be compiled")
+
+
+@cli.command(name='compress-assets', context_settings={
+    'default_selector': '*'
+})
+@click.option('--force', default=False, is_flag=True,
+              help="Compress files which were compressed already")
+@pass_group_context
+def compress_assets(group_context, force):
+    """ Writes the precompressed variants of the static files and of the
+    compiled themes of the selected applications, which are served to
+    browsers accepting them (see :mod:`onegov.town.assets`).
+
+    Run this after the themes are compiled.
+
+    """
+
+    from onegov.town.assets import compress_directory
+
+    directories = set()
+
+    for appcfg, application_ids in selected_applications(group_context):
+        app = create_application(appcfg)
+        directories.update(app.static_files)
+
+        if app.settings.core.theme:
+            directories.add(app.themestorage.getsyspath('/'))
+
+    total = 0
+
+    for directory in sorted(directories):
+        written = len(tuple(compress_directory(directory, force)))
+        total += written
+
+        click.echo(f"{written} files written to {directory}")
+
+    click.secho(f"{total} files written", fg='green')
+
+
+@cli.command(name='prewarm', context_settings={'default_selector': '*'})
+@click.option('--processes', default=None, type=int,
+              help="Number of towns prewarmed at the same time "
+                   "(defaults to the cpu count)")
+@pass_group_context
+def prewarm(group_context, processes):
+    """ Prewarms the caches of the selected towns after a release: The
+    themes, the translations and the application cache.
+
+    """
+
+    from onegov.town.theme.precompile import precompile_themes
+
+    failed = 0
+    total = 0
+
+    for appcfg, application_ids in selected_applications(group_context):
+        app = create_application(appcfg)
+
+        click.secho(f"Prewarming {len(application_ids)} applications "
+                    f"of {appcfg.namespace}", underline=True)
+
+        if app.settings.core.theme:
+            for result in precompile_themes(app, application_ids, processes):
+                if result.error:
+                    click.secho("{} failed after {:.2f}s: {}".format(
+                        result.filename, result.duration, result.error
+                    ), fg='red')
+                else:
+                    click.echo("{} compiled in {:.2f}s".format(
+                        result.filename, result.duration))
+
+        results = prewarm_applications(
+            app_class=appcfg.application_class,
+            namespace=appcfg.namespace,
+            configuration=appcfg.configuration,
+            application_ids=application_ids,
+            processes=processes
+        )
+
+        for ix, result in enumerate(results, start=1):
+            total += 1
+            progress = f"[{ix}/{len(application_ids)}]"
+
+            if result.error:
+                failed += 1
+                click.secho("{} {} failed after {:.2f}s: {}".format(
+                    progress, result.application_id, result.duration,
+                    result.error
+                ), fg='red')
+            else:
+                click.secho("{} {} prewarmed in {:.2f}s".format(
+                    progress, result.application_id, result.duration
+                ), fg='green')
+
+    if failed:
+        abort(f"{failed} of {total} applications could not be prewarmed")
+
+
+@cli.command(name='import-profile', context_settings={
+    'matches_required': False
+})
+@click.option('--module', 'modules', multiple=True, default=DEFAULT_MODULES,
+              help="The modules to profile (may be given multiple times)")
+@click.option('--limit', default=20, type=int,
+              help="Number of the slowest imports shown per module")
+@click.option('--output', default=None, type=click.File('w'),
+              help="Writes the import times of all modules to a JSON file")
+def import_profile(modules, limit, output):
+    """ Measures the time it takes to import the given modules, each in a
+    new interpreter. Requires Python 3.7.
+
+    Use --output to store the results and compare them between releases.
+
+    """
+
+    try:
+        results = profile(modules)
+    except RuntimeError as e:
+        abort(str(e))
+
+    for module, times in results.items():
+        click.secho(f"{module}: {total_time(times):.3f}s", underline=True)
+
+        slowest = sorted(times, key=lambda t: t.self, reverse=True)[:limit]
+
+        for t in slowest:
+            click.echo(f"{t.self:.3f}s {t.cumulative:.3f}s {t.module}")
+
+    if output:
+        json.dump({
+            module: {
+                'total': total_time(times),
+                'imports': [t._asdict() for t in times]
+            } for module, times in results.items()
+        }, output, indent=2)
@@ -0,0 +1,57 @@
+""" Summarizes the availability of daypasses (e.g. the SBB daypasses sold by
+each town), so it can be shown without loading the allocations.
+
+The daypasses of a day are a whole-day allocation with a quota. Libres only
+stores the master allocation, the mirrors (one per daypass) are created once
+they are reserved. The daypasses left are therefore the quota of the master
+allocation, less the allocations of its group with reserved slots.
+
+The summary is computed with a single query and kept by the application
+until an allocation or a reserved slot changes (see
+:meth:`onegov.town.app.TownApp.daypass_availability`).
+
+"""
+
+import sedate
+
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from libres.db.models import Allocation, ReservedSlot
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+
+def daypass_availability(session, resource, start, weeks):
+    """ Returns the number of daypasses left per day, starting with the
+    given date, for the given number of weeks.
+
+    Days without daypasses are not included. The dates are local to the
+    timezone of the resource.
+
+    """
+
+    def as_utc(date):
+        return sedate.replace_timezone(
+            datetime.combine(date, time()), resource.timezone)
+
+    end = start + timedelta(weeks=weeks)
+
+    # the mirrors of the master allocation with reserved slots
+    mirror = aliased(Allocation)
+    reserved = session.query(func.count(ReservedSlot.allocation_id.distinct()))
+    reserved = reserved.join(mirror, mirror.id == ReservedSlot.allocation_id)
+    reserved = reserved.filter(mirror.mirror_of == Allocation.mirror_of)
+    reserved = reserved.filter(mirror._start == Allocation._start)
+    reserved = reserved.correlate(Allocation).as_scalar()
+
+    query = session.query(Allocation._start, Allocation.quota - reserved)
+    query = query.filter(Allocation.resource == resource.id)
+    query = query.filter(Allocation.mirror_of == resource.id)
+    query = query.filter(Allocation._start >= as_utc(start))
+    query = query.filter(Allocation._start < as_utc(end))
+    query = query.order_by(Allocation._start)
+
+    return OrderedDict(
+        (sedate.to_timezone(day, resource.timezone).date(), left)
+        for day, left in query
+    )
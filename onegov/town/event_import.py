@@ -0,0 +1,347 @@
+""" Imports large numbers of events, e.g. for towns migrating from a legacy
+system.
+
+The events are read from YAML, CSV or iCalendar files as a stream and
+imported in batches. Instead of adding each event and each occurrence
+through the ORM, the rows of a batch are inserted with a single statement
+per table. Therefore the memory used does not depend on the number of
+events imported.
+
+The supported formats:
+
+* YAML: One document per event, separated by ``---``.
+* CSV: One row per event, with a header row. Tags are separated by commas.
+* iCalendar: One VEVENT per event.
+
+All formats use the same fields: title, start, end, timezone, recurrence,
+location, tags, description, organizer and source (the uid for iCalendar).
+Only title, start and end are required. Dates without time are imported as
+whole day events, dates without timezone as local dates.
+
+Since the rows are not inserted through the ORM, the imported events are
+not indexed. Run ``onegov-search reindex`` after the import.
+
+"""
+
+import csv
+import isodate
+import re
+
+from datetime import datetime, timedelta
+from icalendar import Event as vEvent
+from itertools import islice
+from onegov.core.utils import increment_name, normalize_for_url
+from onegov.event import Event, Occurrence
+from sedate import as_datetime, replace_timezone, standardize_date, utcnow
+from sqlalchemy import func
+from uuid import uuid4
+from yaml import BaseLoader, load_all
+from zope.sqlalchemy import mark_changed
+
+
+#: the timezone of the imported events, unless given
+DEFAULT_TIMEZONE = 'Europe/Zurich'
+
+#: the fields of an imported event
+FIELDS = (
+    'title', 'start', 'end', 'timezone', 'recurrence', 'location', 'tags',
+    'description', 'organizer', 'source'
+)
+
+_number_suffix = re.compile(r'-[0-9]+$')
+
+
+def get_event_reader(path):
+    """ Returns the reader of the given file, depending on its extension.
+
+    Raises a ValueError if the format is not supported.
+
+    """
+
+    if path.endswith(('.yml', '.yaml')):
+        return read_yaml
+
+    if path.endswith('.csv'):
+        return read_csv
+
+    if path.endswith('.ics'):
+        return read_ical
+
+    raise ValueError(f"Unsupported file format: {path}")
+
+
+def read_events(path):
+    """ Yields the events of the given YAML, CSV or iCalendar file, as
+    dictionaries (see :data:`FIELDS`).
+
+    """
+
+    reader = get_event_reader(path)
+
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from reader(f)
+
+
+def read_yaml(lines):
+
+    # all values are read as strings, like the values of the other formats
+    for document in load_all(lines, Loader=BaseLoader):
+        if document:
+            yield parse_event(document)
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        row = {key: value for key, value in row.items() if value}
+
+        if 'tags' in row:
+            row['tags'] = [tag.strip() for tag in row['tags'].split(',')]
+
+        yield parse_event(row)
+
+
+def read_ical(lines):
+    component = []
+
+    for line in lines:
+        if line.startswith('BEGIN:VEVENT'):
+            component = [line]
+        elif component:
+            component.append(line)
+
+            if line.startswith('END:VEVENT'):
+                yield parse_vevent(vEvent.from_ical(''.join(component)))
+                component = []
+
+
+def parse_event(values):
+    """ Returns the event of the given YAML document or CSV row, with
+    localized dates.
+
+    """
+
+    unknown = set(values) - set(FIELDS)
+
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    event = dict.fromkeys(FIELDS)
+    event.update(values)
+    event['timezone'] = event['timezone'] or DEFAULT_TIMEZONE
+    event['tags'] = event['tags'] or []
+
+    if not event['title'] or not event['start'] or not event['end']:
+        raise ValueError(f"Missing title, start or end: {values}")
+
+    event['start'] = parse_date(event['start'], event['timezone'])
+    event['end'] = parse_date(event['end'], event['timezone'], end=True)
+
+    return event
+
+
+def parse_vevent(vevent):
+    """ Returns the event of the given VEVENT, like
+    :meth:`onegov.event.EventCollection.from_ical`.
+
+    """
+
+    timezone = DEFAULT_TIMEZONE
+
+    start = vevent.get('dtstart')
+    end = vevent.get('dtend')
+    duration = vevent.get('duration')
+
+    if not start or not (end or duration):
+        raise ValueError(f"Missing start or end: {vevent.get('uid')}")
+
+    start = parse_date(start.dt, timezone)
+
+    if end:
+        end = parse_date(end.dt, timezone, end=True)
+    else:
+        end = start + duration.dt
+
+    recurrence = vevent.get('rrule')
+
+    if recurrence:
+        recurrence = 'RRULE:{}'.format(recurrence.to_ical().decode())
+
+    tags = vevent.get('categories') or []
+
+    # categories may be in lists or they may be single values
+    if not isinstance(tags, list):
+        tags = [tags]
+
+    return {
+        'title': str(vevent.get('summary', '')),
+        'start': start,
+        'end': end,
+        'timezone': timezone,
+        'recurrence': recurrence,
+        'location': str(vevent.get('location', '')),
+        'tags': [str(cat) for tag in tags for cat in tag.cats],
+        'description': str(vevent.get('description', '')),
+        'organizer': str(vevent.get('organizer', '')),
+        'source': vevent.get('uid') and f"ical-{vevent.get('uid')}",
+    }
+
+
+def parse_date(value, timezone, end=False):
+    """ Returns the given date, datetime or ISO 8601 string as UTC datetime.
+
+    Dates are turned into whole days, naive datetimes are localized using
+    the given timezone.
+
+    """
+
+    if isinstance(value, str):
+        value = value.strip()
+
+        if len(value) > 10:
+            value = isodate.parse_datetime(value.replace(' ', 'T', 1))
+        else:
+            value = isodate.parse_date(value)
+
+    if not isinstance(value, datetime):
+        value = as_datetime(value)
+
+        if end:
+            value += timedelta(days=1, minutes=-1)
+
+        return standardize_date(replace_timezone(value, timezone), 'UTC')
+
+    return standardize_date(value, timezone)
+
+
+def batched(items, size):
+    """ Splits the given iterable into lists of the given size, without
+    reading more items than needed.
+
+    """
+
+    iterator = iter(items)
+
+    while True:
+        batch = list(islice(iterator, size))
+
+        if not batch:
+            break
+
+        yield batch
+
+
+def unique_names(session, titles):
+    """ Returns a unique, URL-friendly name for each given title, like
+    :meth:`onegov.event.EventCollection.add`.
+
+    Uses a single query for all titles.
+
+    """
+
+    names = [normalize_for_url(title) or 'event' for title in titles]
+    stems = {_number_suffix.sub('', name) for name in names}
+
+    query = session.query(Event.name)
+    query = query.filter(
+        func.regexp_replace(Event.name, _number_suffix.pattern, '').in_(stems))
+
+    taken = {name for name, in query}
+
+    for ix, name in enumerate(names):
+        while name in taken:
+            name = increment_name(name)
+
+        taken.add(name)
+        names[ix] = name
+
+    return names
+
+
+def import_events(session, events, batch_size=500):
+    """ Imports the given events as published events. Returns the number of
+    events and occurrences imported.
+
+    :param events:
+        An iterable of events (see :func:`read_events`). It is only read as
+        far as needed for the current batch.
+
+    :param batch_size:
+        The number of events inserted at once. Occurrences are inserted in
+        batches of the same size.
+
+    The changes are not committed. As with :meth:`Event._update_occurrences`,
+    occurrences are only created for this and the next year.
+
+    """
+
+    events_count = occurrences_count = 0
+
+    for batch in batched(events, batch_size):
+        event_rows = []
+        occurrence_rows = []
+
+        created = utcnow()
+        names = unique_names(session, (e['title'] for e in batch))
+
+        for values, name in zip(batch, names):
+
+            # the (transient) event validates the recurrence and expands it
+            event = Event(
+                id=uuid4(),
+                state='initiated',
+                name=name,
+                title=values['title'],
+                start=values['start'],
+                end=values['end'],
+                timezone=values['timezone'],
+                recurrence=values['recurrence'] or None,
+                location=values['location'],
+                tags=values['tags'],
+            )
+
+            meta = {'source': values['source']} if values['source'] else {}
+
+            event_rows.append({
+                'id': event.id,
+                'state': 'published',
+                'name': event.name,
+                'title': event.title,
+                'start': event.start,
+                'end': event.end,
+                'timezone': event.timezone,
+                'recurrence': event.recurrence,
+                'location': event.location,
+                'tags': event._tags,
+                'content': {
+                    'description': values['description'] or '',
+                    'organizer': values['organizer'] or '',
+                },
+                'meta': meta,
+                'created': created
+            })
+
+            for start in event.occurrence_dates():
+                occurrence_rows.append({
+                    'id': uuid4(),
+                    'event_id': event.id,
+                    'name': f'{event.name}-{start.date().isoformat()}',
+                    'title': event.title,
+                    'start': start,
+                    'end': start + (event.end - event.start),
+                    'timezone': event.timezone,
+                    'location': event.location,
+                    'tags': event._tags,
+                    'created': created
+                })
+
+        session.execute(Event.__table__.insert().values(event_rows))
+
+        for rows in batched(occurrence_rows, batch_size):
+            session.execute(Occurrence.__table__.insert().values(rows))
+
+        events_count += len(event_rows)
+        occurrences_count += len(occurrence_rows)
+
+    mark_changed(session)
+
+    return events_count, occurrences_count
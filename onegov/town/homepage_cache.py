@@ -0,0 +1,173 @@
+""" Provides an output cache for the homepage, served to anonymous visitors
+without handling the request (and therefore without touching the database).
+
+The cache is opt-in and configured through the application config::
+
+    homepage_cache:
+        max_size: 16777216   # maximum size of the local cache in bytes
+        max_age: 300         # maximum age of entries in seconds
+        shared: true         # share the entries through the app cache
+
+The entries are kept in a local LRU cache. If a shared backend is used,
+entries are shared between processes and each tenant has a generation
+stored in the backend. Changing the generation invalidates the entries of
+all processes.
+
+"""
+
+import threading
+import time
+
+from collections import Counter, OrderedDict
+from dogpile.cache.api import NO_VALUE
+from onegov.core.crypto import random_token
+from webob import Response
+
+
+#: the tables which, when changed, invalidate the cached homepage
+HOMEPAGE_TABLES = frozenset((
+    'allocations',
+    'directories',
+    'event_occurrences',
+    'events',
+    'files',
+    'filesets',
+    'organisations',
+    'pages',
+    'reserved_slots',
+    'resources',
+))
+
+
+class CachedResponse(object):
+    """ A response stored in the homepage cache. """
+
+    __slots__ = ('status', 'headers', 'body', 'created')
+
+    def __init__(self, status, headers, body, created=None):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.created = created or time.time()
+
+    def __getstate__(self):
+        return (self.status, self.headers, self.body, self.created)
+
+    def __setstate__(self, state):
+        self.status, self.headers, self.body, self.created = state
+
+    @property
+    def size(self):
+        return len(self.body)
+
+    def is_expired(self, max_age):
+        return self.created + max_age < time.time()
+
+    def __call__(self, environ, start_response):
+        # handles If-None-Match, using the ETag of the homepage
+        response = Response(
+            status=self.status,
+            headerlist=list(self.headers),
+            body=self.body,
+            conditional_response=True
+        )
+
+        return response(environ, start_response)
+
+
+class HomepageCache(object):
+    """ A local LRU cache of homepage responses, bounded by the total size
+    of the stored bodies, with an optional shared backend.
+
+    The shared backend is expected to be bound to the tenant and to behave
+    like a dogpile cache region (``get``, ``set``, ``delete``).
+
+    """
+
+    def __init__(self, max_size=16 * 1024 * 1024, max_age=300, shared=True):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.shared = shared
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        #: hits, misses and invalidations of this process
+        self.stats = Counter(hits=0, misses=0, invalidations=0)
+
+    def generation(self, backend):
+        if backend is None:
+            return None
+
+        generation = backend.get('generation')
+        return None if generation is NO_VALUE else generation
+
+    def get(self, tenant, key, backend=None):
+        """ Returns the cached response for the given tenant and key or
+        None.
+
+        """
+        generation = self.generation(backend)
+        local_key = (tenant, generation, key)
+
+        with self.lock:
+            response = self.entries.get(local_key)
+
+            if response is not None:
+                if response.is_expired(self.max_age):
+                    self.remove(local_key)
+                    response = None
+                else:
+                    self.entries.move_to_end(local_key)
+
+        if response is None and backend is not None:
+            response = backend.get(f'{generation}:{key}')
+            response = None if response is NO_VALUE else response
+
+            if response is not None and not response.is_expired(self.max_age):
+                self.store(local_key, response)
+            else:
+                response = None
+
+        self.stats['hits' if response is not None else 'misses'] += 1
+        return response
+
+    def set(self, tenant, key, response, backend=None):
+        """ Stores the response for the given tenant and key. """
+
+        if response.size > self.max_size:
+            return
+
+        generation = self.generation(backend)
+        self.store((tenant, generation, key), response)
+
+        if backend is not None:
+            backend.set(f'{generation}:{key}', response)
+
+    def store(self, local_key, response):
+        with self.lock:
+            if local_key in self.entries:
+                self.remove(local_key)
+
+            self.entries[local_key] = response
+            self.size += response.size
+
+            while self.size > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, local_key):
+        self.size -= self.entries.pop(local_key).size
+
+    def invalidate(self, tenant, backend=None):
+        """ Removes all responses of the given tenant. """
+
+        self.stats['invalidations'] += 1
+
+        if backend is not None:
+            backend.set('generation', random_token())
+
+        with self.lock:
+            for local_key in tuple(self.entries):
+                if local_key[0] == tenant:
+                    self.remove(local_key)
@@ -0,0 +1,89 @@
+""" Provides a cache of compiled homepage templates, shared by all tenants
+of a process.
+
+The homepage structure of a tenant is transformed into a chameleon template
+using the templates of the registered widgets. Since most towns use the
+same structure, the compiled template is cached by the hash of the structure
+and the hash of the registered widgets, not by tenant.
+
+"""
+
+import hashlib
+import threading
+
+from chameleon import PageTemplate
+from collections import Counter, OrderedDict
+from onegov.org.homepage_widgets import transform_homepage_structure
+
+
+class HomepageTemplateCache(object):
+    """ A bounded LRU cache of compiled homepage templates. """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+
+        self.templates = OrderedDict()
+        self.lock = threading.Lock()
+
+        #: the hash of the registered widgets per application class
+        self.widget_hashes = {}
+
+        #: hits and misses of this process
+        self.stats = Counter(hits=0, misses=0)
+
+    def widgets_hash(self, app):
+        """ Returns the hash of the widgets registered on the given app. """
+
+        cls = app.__class__
+
+        if cls not in self.widget_hashes:
+            registry = app.config.homepage_widget_registry
+
+            digest = hashlib.sha1()
+
+            for tag, widget in sorted(registry.items()):
+                digest.update(tag.encode('utf-8'))
+                digest.update(widget.template.encode('utf-8'))
+
+            self.widget_hashes[cls] = digest.hexdigest()
+
+        return self.widget_hashes[cls]
+
+    def get(self, app, structure):
+        """ Returns the compiled template of the given structure. """
+
+        if not structure:
+            return PageTemplate('')
+
+        key = (
+            hashlib.sha1(structure.encode('utf-8')).hexdigest(),
+            self.widgets_hash(app)
+        )
+
+        with self.lock:
+            template = self.templates.get(key)
+
+            if template is not None:
+                self.templates.move_to_end(key)
+
+        if template is not None:
+            self.stats['hits'] += 1
+            return template
+
+        self.stats['misses'] += 1
+
+        # compiled outside the lock, in the rare case of two threads compiling
+        # the same template, the last one wins
+        template = PageTemplate(transform_homepage_structure(app, structure))
+
+        with self.lock:
+            self.templates[key] = template
+
+            while len(self.templates) > self.max_size:
+                self.templates.popitem(last=False)
+
+        return template
+
+
+#: the homepage templates of all tenants of this process
+homepage_templates = HomepageTemplateCache()
@@ -8,6 +8,11 @@ from onegov.town import TownApp, _
 
 @TownApp.homepage_widget(tag='services')
 class ServicesWidget(object):
+
+    #: the names of the sbb daypass, in order of priority (ga-tageskarte is
+    #: the legacy name)
+    daypass_names = ('sbb-tageskarte', 'ga-tageskarte')
+
     template = """
         <xsl:template match="services">
             <h2 tal:content="services_panel.title"></h2>
@@ -29,7 +34,7 @@ class ServicesWidget(object):
         )
 
         # only if there are publications, will we enable the link to them
-        if not layout.org.hide_publications and layout.app.publications_count:
+        if not layout.org.hide_publications and layout.app.has_publications:
             yield Link(
                 text=_("Publications"),
                 url=layout.request.class_link(PublicationCollection),
@@ -48,27 +53,64 @@ class ServicesWidget(object):
             )
         )
 
-        resources = ResourceCollection(layout.app.libres_context)
+        daypasses = layout.app.resources_by_name(self.daypass_names)
 
-        # ga-tageskarte is the legacy name
-        sbb_daypass = resources.by_name('sbb-tageskarte') \
-            or resources.by_name('ga-tageskarte')
+        if daypasses:
+            sbb_daypass = daypasses[0]
 
-        if sbb_daypass:
             yield Link(
                 text=_("SBB Daypass"),
                 url=layout.request.link(sbb_daypass),
-                subtitle=(
-                    layout.org.meta.get('daypass_label')
-                    or _("Generalabonnement for Towns")
-                )
+                subtitle=self.get_daypass_subtitle(layout, sbb_daypass)
             )
 
+    def get_daypass_subtitle(self, layout, daypass):
+        subtitle = (
+            layout.org.meta.get('daypass_label')
+            or _("Generalabonnement for Towns")
+        )
+
+        left = layout.app.daypasses_left_today(daypass)
+
+        if left is None:
+            return subtitle
+
+        translate = layout.request.translate
+
+        return '{} – {}'.format(translate(subtitle), translate(
+            _("${count} left today", mapping={'count': left})
+        ))
+
+    def get_daypass_today(self, layout):
+        """ Returns the current day of the daypass shown (as in
+        :meth:`onegov.town.app.TownApp.daypass_today`), without loading
+        the daypass, or None if there's no daypass.
+
+        """
+        timezones = layout.app.resource_timezones_by_name
+
+        for name in self.daypass_names:
+            if name in timezones:
+                return layout.app.today_in(timezones[name])
+
+    def get_services_panel(self, layout):
+        return LinkGroup(_("Services"), links=tuple(
+            self.get_service_links(layout)
+        ))
+
     def get_variables(self, layout):
+        request = layout.request
+
+        # the links are absolute, so they depend on the (virtual) url as
+        # well, the daypasses left are shown for the current day of the
+        # daypass
+        today = self.get_daypass_today(layout)
+        key = (request.locale, request.virtual_base_url, str(today))
+
         return {
-            'services_panel': LinkGroup(_("Services"), links=tuple(
-                self.get_service_links(layout)
-            ))
+            'services_panel': layout.app.services_panel_cache.get_or_create(
+                key, creator=lambda: self.get_services_panel(layout)
+            )
         }
 
 
@@ -0,0 +1,194 @@
+""" Provides precompiled, lazily loaded translations for onegov.town.
+
+By default, onegov.core compiles all po files of all locale directories
+whenever an application process starts. Instead, the po files of each
+language are merged into a single mo file, named after the hash of the po
+files. The mo files are stored in ``locale/compiled`` and only compiled
+again if a po file changes (e.g. after an update of onegov.org).
+
+The translations are loaded when a language is first used.
+
+To precompile the translations (e.g. before building a release) and to
+measure the time it takes to load them, run::
+
+    python -m onegov.town.i18n
+
+"""
+
+import gettext
+import hashlib
+import os
+import polib
+import threading
+
+from collections.abc import Mapping
+from io import BytesIO
+from onegov.core.i18n import pofiles, wrap_translations_for_chameleon
+from onegov.core.utils import module_path
+from onegov.town import log
+
+
+#: the directory in which the compiled translations are stored
+COMPILED_PATH = 'locale/compiled'
+
+
+def normalize_language(language):
+    """ Turns 'de_ch' into 'de_CH' and 'FR' into 'fr'. """
+
+    if '_' in language:
+        code, country = language.split('_')
+        return '_'.join((code.lower(), country.upper()))
+
+    return language.lower()
+
+
+def pofiles_by_language(localedirs):
+    """ Returns the po files of the given locale directories by language,
+    in the order of the locale directories.
+
+    """
+    result = {}
+
+    for localedir in localedirs:
+        for language, path in sorted(pofiles(localedir)):
+            result.setdefault(normalize_language(language), []).append(path)
+
+    return result
+
+
+def merge_pofiles(paths):
+    """ Merges the given po files into a single po file. Like in
+    :func:`onegov.core.i18n.get_translations`, the translations of the first
+    po file override the translations of the following po files.
+
+    """
+    merged = polib.POFile()
+    seen = set()
+
+    for path in paths:
+        po = polib.pofile(path)
+
+        if not merged.metadata:
+            merged.metadata = po.metadata
+
+        for entry in po.translated_entries():
+            key = (entry.msgctxt, entry.msgid)
+
+            if key not in seen:
+                seen.add(key)
+                merged.append(entry)
+
+    return merged
+
+
+def compile_translation(language, paths, directory):
+    """ Returns the translation of the given language, merged from the given
+    po files. The merged translation is stored as mo file in the given
+    directory and only compiled again if one of the po files changes.
+
+    """
+    digest = hashlib.sha1()
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+
+    mofile = os.path.join(directory, f'{language}-{digest.hexdigest()}.mo')
+
+    if not os.path.exists(mofile):
+        log.info(f"Compiling translations for {language}")
+        binary = merge_pofiles(paths).to_binary()
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            # write the file atomically, as multiple processes might compete
+            temp = f'{mofile}.{os.getpid()}.tmp'
+
+            with open(temp, 'wb') as f:
+                f.write(binary)
+
+            os.replace(temp, mofile)
+        except OSError:
+            # the package might be installed read-only, in which case we
+            # compile the translations once per process
+            log.warning(f"Could not write the translations to {mofile}")
+            return gettext.GNUTranslations(BytesIO(binary))
+
+    with open(mofile, 'rb') as f:
+        return gettext.GNUTranslations(f)
+
+
+class LazyTranslations(Mapping):
+    """ The translations of the given locale directories by language. The
+    languages are known upfront, the translations are loaded when they are
+    first accessed.
+
+    """
+
+    def __init__(self, localedirs, directory=None):
+        self.pofiles = pofiles_by_language(localedirs)
+        self.directory = directory or module_path('onegov.town', COMPILED_PATH)
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, language):
+        if language not in self.loaded:
+            paths = self.pofiles[language]
+
+            with self.lock:
+                if language not in self.loaded:
+                    self.loaded[language] = compile_translation(
+                        language, paths, self.directory)
+
+        return self.loaded[language]
+
+    def __iter__(self):
+        return iter(self.pofiles)
+
+    def __len__(self):
+        return len(self.pofiles)
+
+
+class LazyChameleonTranslations(Mapping):
+    """ Wraps the given lazy translations for use with Chameleon, once they
+    are first accessed.
+
+    """
+
+    def __init__(self, translations):
+        self.translations = translations
+        self.wrapped = {}
+
+    def __getitem__(self, language):
+        if language not in self.wrapped:
+            self.wrapped.update(wrap_translations_for_chameleon({
+                language: self.translations[language]
+            }))
+
+        return self.wrapped[language]
+
+    def __iter__(self):
+        return iter(self.translations)
+
+    def __len__(self):
+        return len(self.translations)
+
+
+if __name__ == '__main__':
+    import time
+
+    from onegov.core import i18n
+    from onegov.town.app import get_i18n_localedirs
+
+    localedirs = get_i18n_localedirs()
+
+    start = time.perf_counter()
+    i18n.get_translations(localedirs)
+    print(f"onegov.core: {time.perf_counter() - start:.3f}s for all languages")
+
+    for language in pofiles_by_language(localedirs):
+        for run in ('first run', 'second run'):
+            start = time.perf_counter()
+            LazyTranslations(localedirs)[language]
+            print(f"{language}: {time.perf_counter() - start:.3f}s ({run})")
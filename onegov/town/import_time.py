@@ -0,0 +1,107 @@
+""" Measures the time it takes to import modules, using the ``-X importtime``
+option of Python 3.7+.
+
+Each module is imported in a new interpreter, so the results do not depend
+on what has been imported before. To print the slowest imports of the cli::
+
+    python -m onegov.town.import_time onegov.town.cli
+
+"""
+
+import subprocess
+import sys
+
+from collections import namedtuple
+
+
+#: the modules profiled by default
+DEFAULT_MODULES = ('onegov.town', 'onegov.town.cli', 'onegov.town.app')
+
+#: printed before the measured module is imported
+MARKER = '-- onegov.town.import_time --'
+
+#: the import time of a single module, in seconds
+ImportTime = namedtuple(
+    'ImportTime', ('module', 'self', 'cumulative', 'depth'))
+
+
+def measure_import(module):
+    """ Imports the given module in a new interpreter and returns the
+    :class:`ImportTime` of each module imported as a result, in the order
+    reported by Python (dependencies first).
+
+    """
+
+    if sys.version_info < (3, 7):
+        raise RuntimeError("Measuring the import time requires Python 3.7")
+
+    # the marker separates the imports of the module from those at startup
+    code = f"import sys; print('{MARKER}', file=sys.stderr, flush=True); " \
+        f"import {module}"
+
+    process = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', code),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if process.returncode != 0:
+        raise RuntimeError(f"Could not import {module}: {process.stderr}")
+
+    output = process.stderr.split(MARKER, 1)[-1]
+
+    return list(parse_import_times(output.splitlines()))
+
+
+def parse_import_times(lines):
+    """ Parses the output of ``-X importtime``, which looks like this::
+
+        import time: self [us] | cumulative | imported package
+        import time:       141 |        141 |   _frozen_importlib_external
+        import time:        60 |        201 | encodings
+
+    """
+
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+
+        self, cumulative, name = line[len('import time:'):].split('|')
+
+        if not self.strip().isdigit():
+            continue  # the header
+
+        module = name.lstrip(' ')
+        depth = (len(name) - len(module) - 1) // 2
+
+        yield ImportTime(
+            module.rstrip(),
+            int(self) / 1000000,
+            int(cumulative) / 1000000,
+            depth
+        )
+
+
+def total_time(times):
+    """ Returns the total time spent importing, given the result of
+    :func:`measure_import`.
+
+    """
+    return sum(time.cumulative for time in times if time.depth == 0)
+
+
+def profile(modules=DEFAULT_MODULES):
+    """ Returns the import times of the given modules, keyed by module. """
+
+    return {module: measure_import(module) for module in modules}
+
+
+if __name__ == '__main__':
+    for module in sys.argv[1:] or DEFAULT_MODULES:
+        times = measure_import(module)
+
+        print(f"{module}: {total_time(times):.3f}s")
+
+        for time in sorted(times, key=lambda t: t.self, reverse=True)[:20]:
+            print(f"  {time.self:.3f}s {time.module}")
@@ -1,23 +1,50 @@
-from onegov.core.utils import module_path
+import time
+import transaction
+
+from collections import namedtuple
+from multiprocessing import Pool
+from onegov.core.utils import module_path, scan_morepath_modules
+from onegov.form import FormDefinition
 from onegov.reservation import ResourceCollection
-from onegov.org.initial_content import add_builtin_forms
-from onegov.org.initial_content import builtin_form_definitions
 from onegov.org.initial_content import add_filesets, add_pages, load_content
 from onegov.org.initial_content import add_events
 from onegov.org.models import Organisation
+from onegov.town.builtin_forms import builtin_forms
+from onegov.town.event_import import import_events, read_events
+
+
+#: the initial content of each locale
+CONTENT_PATHS = {
+    'de_CH': 'content/de.yaml',
+    'fr_CH': 'content/fr.yaml',
+}
+
+
+#: the outcome of provisioning a single town
+ProvisioningResult = namedtuple(
+    'ProvisioningResult', ('application_id', 'name', 'duration', 'error'))
 
 
 def create_new_organisation(app, name, reply_to=None, forms=None,
-                            create_files=True, path=None, locale='de_CH'):
-    session = app.session()
+                            create_files=True, path=None, locale='de_CH',
+                            events=None, content=None):
+    """ Creates the organisation and the initial content of a town.
 
-    locales = {
-        'de_CH': 'content/de.yaml',
-        'fr_CH': 'content/fr.yaml',
-    }
+    :param content:
+        The parsed content of the given path (see
+        :func:`onegov.org.initial_content.load_content`), if it has already
+        been loaded.
 
-    path = path or module_path('onegov.town', locales[locale])
-    content = load_content(path)
+    :param events:
+        The path to a YAML, CSV or iCalendar file with events which are
+        imported in addition to the sample events (see
+        :mod:`onegov.town.event_import`).
+
+    """
+    session = app.session()
+
+    path = path or module_path('onegov.town', CONTENT_PATHS[locale])
+    content = content or load_content(path)
 
     # can only be called if no organisation is defined yet
     assert not session.query(Organisation).first()
@@ -27,13 +54,7 @@ def create_new_organisation(app, name, reply_to=None, forms=None,
     org.meta['locales'] = locale
     session.add(org)
 
-    form_locales = {
-        'de_CH': 'forms/builtin/de',
-        'fr_CH': 'forms/builtin/fr',
-    }
-
-    forms = forms or builtin_form_definitions(
-        module_path('onegov.town', form_locales[locale]))
+    forms = forms or builtin_forms(locale)
 
     translator = app.translations.get(locale)
 
@@ -45,12 +66,46 @@ def create_new_organisation(app, name, reply_to=None, forms=None,
     add_resources(app.libres_context)
     add_events(session, name, translate, create_files)
 
+    if events:
+        import_events(session, read_events(events))
+
     if create_files:
         add_filesets(session, name, path)
 
     session.flush()
 
 
+def add_builtin_forms(session, forms):
+    """ Adds the given precompiled builtin forms (see
+    :mod:`onegov.town.builtin_forms`).
+
+    Unlike :func:`onegov.org.initial_content.add_builtin_forms` this doesn't
+    parse the forms again to check for a required e-mail field, as this is
+    done when the forms are compiled. The forms are inserted together,
+    instead of looking up and flushing each form on its own.
+
+    """
+    existing = {name for name, in session.query(FormDefinition.name)}
+    form_class = FormDefinition.get_polymorphic_class('custom', FormDefinition)
+
+    for form in forms:
+        assert form.has_required_email_field, (
+            "Each form must have at least one required email field"
+        )
+
+        if form.name not in existing:
+            session.add(form_class(
+                name=form.name,
+                title=form.title,
+                definition=form.definition,
+                type='custom',
+                meta={},
+                content={}
+            ))
+
+    session.flush()
+
+
 def add_resources(libres_context):
     resource = ResourceCollection(libres_context)
     resource.add(
@@ -59,3 +114,104 @@ def add_resources(libres_context):
         type='daypass',
         name='sbb-tageskarte'
     )
+
+
+def create_new_organisations(app_class, namespace, configuration, towns,
+                             locale='de_CH', create_files=True,
+                             processes=None, events=None):
+    """ Provisions many towns at once, using a pool of processes. Yields a
+    :class:`ProvisioningResult` for each town, as soon as it is done.
+
+    :param app_class:
+        The application class (e.g. :class:`onegov.town.TownApp`).
+
+    :param namespace:
+        The namespace of the application (e.g. 'onegov_town').
+
+    :param configuration:
+        The configuration passed to the application.
+
+    :param towns:
+        A dictionary of application ids (without namespace) and town names.
+
+    :param events:
+        The path to a file with events imported into each town (see
+        :func:`create_new_organisation`).
+
+    The content and the forms are parsed once and handed to each worker
+    process when it is started.
+
+    """
+
+    content = load_content(module_path('onegov.town', CONTENT_PATHS[locale]))
+    forms = builtin_forms(locale)
+
+    tasks = (
+        (f'{namespace}/{id}', name, locale, create_files, events)
+        for id, name in towns.items()
+    )
+
+    initargs = (app_class, namespace, configuration, content, forms)
+
+    with Pool(processes, initializer=setup_worker, initargs=initargs) as pool:
+        yield from pool.imap_unordered(provision_town, tasks)
+
+
+#: the application instance of a provisioning worker process
+worker_app = None
+
+#: the parsed content and the forms used by a provisioning worker process
+worker_content = None
+worker_forms = None
+
+
+def setup_worker(app_class, namespace, configuration, content, forms):
+    """ Sets up the application instance of a provisioning worker process.
+    """
+    global worker_app, worker_content, worker_forms
+
+    worker_content = content
+    worker_forms = forms
+
+    scan_morepath_modules(app_class)
+    app_class.commit()
+
+    worker_app = app_class()
+    worker_app.namespace = namespace
+    worker_app.configure_application(**configuration)
+
+
+def provision_town(task):
+    """ Provisions a single town, used by :func:`create_new_organisations`.
+
+    Errors are not raised, but returned as part of the result, so a single
+    town does not stop the provisioning of the others.
+
+    """
+    application_id, name, locale, create_files, events = task
+
+    start = time.perf_counter()
+
+    try:
+        worker_app.set_application_id(application_id)
+        worker_app.clear_request_cache()
+
+        create_new_organisation(
+            worker_app, name, forms=worker_forms, create_files=create_files,
+            locale=locale, events=events, content=worker_content)
+
+        transaction.commit()
+
+        # the documents are sent in bulk, the rest is sent now as the worker
+        # might not commit another transaction for a while
+        if worker_app.es_client:
+            worker_app.es_indexer.flush()
+    except Exception as e:
+        transaction.abort()
+        error = f'{e.__class__.__name__}: {e}'
+    else:
+        error = None
+
+    duration = time.perf_counter() - start
+
+    return ProvisioningResult(application_id, name, duration, error)
@@ -0,0 +1,284 @@
+""" Provides a connection pool for processes serving many tenants, which
+keeps its connections pinned to the schemas of the most recently used
+tenants.
+
+The session manager of onegov.core sets the ``search_path`` before every
+statement (and the idle timeout of the session as well), as a connection
+may have been used by another tenant before. Instead, this pool remembers
+the schema of each connection and hands out a connection which is already
+set to the current schema, if there's one. The ``search_path`` is then only
+set if a connection is used by another tenant.
+
+The pool is opt-in and configured through the application config::
+
+    schema_pinned_pool:
+        pool_size: 20     # connections kept open (pinned to a schema)
+
+If the pool is full, the connection of the least recently used schema is
+switched to the current schema instead. Connections opened beyond the size
+of the pool (by concurrent requests) are closed when they are returned.
+
+"""
+
+import threading
+
+from collections import Counter, OrderedDict
+from onegov.core.orm import SessionManager
+from onegov.core.orm.session_manager import CONNECTION_LIFETIME
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+
+class SchemaPinnedPool(Pool):
+    """ A pool which keeps up to ``pool_size`` connections, each pinned to
+    the schema it was last used with. Connections pinned to the current
+    schema are preferred. Otherwise a new connection is opened, or if the
+    pool is full, the connection of the least recently used schema is used.
+
+    The number of connections checked out at the same time is not limited,
+    like the default pool of onegov.core.
+
+    :param schema_provider:
+        A callable returning the current schema.
+
+    :param stats:
+        A counter, to which the checkouts, hits, misses and evictions of the
+        pool are added.
+
+    :param lock:
+        The lock guarding the pool and the counter (shared with the pools
+        recreated from this one, as they use the same counter).
+
+    """
+
+    def __init__(self, creator, pool_size=5, schema_provider=None,
+                 stats=None, lock=None, **kw):
+        super().__init__(creator, **kw)
+
+        self._pool_size = pool_size
+        self._schema_provider = schema_provider or (lambda: None)
+        self._stats = stats if stats is not None else Counter()
+        self._lock = lock or threading.Lock()
+
+        # the idle connection records, the least recently used first
+        self._idle = OrderedDict()
+        self._checkedout = 0
+
+    def _do_get(self):
+        schema = self._schema_provider()
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._checkedout += 1
+
+            record = self._take_idle(schema)
+
+        if record is not None:
+            return record
+
+        try:
+            return self._create_connection()
+        except Exception:
+            with self._lock:
+                self._checkedout -= 1
+            raise
+
+    def _take_idle(self, schema):
+        """ Removes and returns the most recently used idle connection
+        pinned to the given schema. If there's none, another connection is
+        opened, as long as the pool is not full. Otherwise, the least
+        recently used idle connection is returned (or None).
+
+        """
+
+        for record in reversed(self._idle):
+            if record.info.get('schema') == schema:
+                self._stats['hits'] += 1
+                del self._idle[record]
+                return record
+
+        self._stats['misses'] += 1
+
+        if self._checkedout + len(self._idle) <= self._pool_size:
+            return None
+
+        if self._idle:
+            return self._idle.popitem(last=False)[0]
+
+    def _do_return_conn(self, record):
+        evicted = []
+
+        with self._lock:
+            self._checkedout -= 1
+            self._idle[record] = None
+
+            while len(self._idle) > self._pool_size:
+                evicted.append(self._idle.popitem(last=False)[0])
+                self._stats['evictions'] += 1
+
+        for record in evicted:
+            record.close()
+
+    def recreate(self):
+        self.logger.info("Pool recreating")
+
+        return self.__class__(
+            self._creator,
+            pool_size=self._pool_size,
+            schema_provider=self._schema_provider,
+            stats=self._stats,
+            lock=self._lock,
+            recycle=self._recycle,
+            echo=self.echo,
+            logging_name=self._orig_logging_name,
+            reset_on_return=self._reset_on_return,
+            pre_ping=self._pre_ping,
+            _dispatch=self.dispatch,
+            dialect=self._dialect
+        )
+
+    def dispose(self):
+        with self._lock:
+            records = tuple(self._idle)
+            self._idle.clear()
+
+        for record in records:
+            record.close()
+
+        self.logger.info("Pool disposed. %s", self.status())
+
+    def size(self):
+        return self._pool_size
+
+    def checkedin(self):
+        return len(self._idle)
+
+    def checkedout(self):
+        return self._checkedout
+
+    def status(self):
+        return (
+            f"Pool size: {self.size()}  "
+            f"Connections in pool: {self.checkedin()} "
+            f"Current Checked out connections: {self.checkedout()}"
+        )
+
+
+class SchemaPinnedSessionManager(SessionManager):
+    """ A session manager using the :class:`SchemaPinnedPool`, which only
+    sets the ``search_path`` of a connection if it's not set to the current
+    schema already.
+
+    A ``search_path`` set in a transaction is only remembered once the
+    transaction is committed, as it's reverted otherwise. If a transaction
+    which set the ``search_path`` is rolled back, it's set again the next
+    time the connection is used.
+
+    """
+
+    def __init__(self, dsn, base, pool_size=20, **kwargs):
+
+        #: the checkouts, hits, misses and evictions of the pool, as well as
+        #: the number of times the ``search_path`` was set (switches)
+        self.pool_stats = Counter(
+            checkouts=0, hits=0, misses=0, evictions=0, switches=0)
+
+        #: guards the pool and its statistics
+        self.pool_lock = threading.Lock()
+
+        kwargs['pool_config'] = {
+            'poolclass': SchemaPinnedPool,
+            'pool_size': pool_size,
+            'pool_recycle': CONNECTION_LIFETIME - 1,
+            'schema_provider': lambda: self.current_schema,
+            'stats': self.pool_stats,
+            'lock': self.pool_lock
+        }
+
+        super().__init__(dsn, base, **kwargs)
+
+    @property
+    def pool_hit_rate(self):
+        """ The share of checkouts which received a connection pinned to
+        the current schema.
+
+        """
+        checkouts = self.pool_stats['checkouts']
+        return checkouts and self.pool_stats['hits'] / checkouts or 0.0
+
+    def register_engine(self, engine):
+        """ Replaces the schema switching mechanism of onegov.core, which
+        sets the ``search_path`` before each statement.
+
+        """
+
+        stats = self.pool_stats
+        lock = self.pool_lock
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def activate_schema(connection, cursor, *args, **kwargs):
+
+            # execution options have priority!
+            if 'schema' in connection._execution_options:
+                schema = connection._execution_options['schema']
+            else:
+                if 'session' in connection.info:
+                    schema = connection.info['session'].info['schema']
+                else:
+                    schema = None
+
+            if schema is None:
+                return
+
+            info = connection.info
+            current = info.get('pending_schema', info.get('schema'))
+
+            if current != schema:
+                cursor.execute(
+                    "SET search_path TO %s, extensions", (schema, ))
+
+                info['pending_schema'] = schema
+
+                with lock:
+                    stats['switches'] += 1
+
+        @event.listens_for(engine, 'commit')
+        def pin_schema(connection):
+            if 'pending_schema' in connection.info:
+                connection.info['schema'] = connection.info.pop(
+                    'pending_schema')
+
+        def unpin_schema(info):
+            # the search_path set in the transaction is reverted, but it
+            # might have been committed in between (e.g. by a savepoint or a
+            # raw COMMIT), so we don't know which one is active
+            if 'pending_schema' in info:
+                del info['pending_schema']
+                info.pop('schema', None)
+
+        @event.listens_for(engine, 'rollback')
+        def unpin_after_rollback(connection):
+            unpin_schema(connection.info)
+
+        @event.listens_for(engine, 'rollback_savepoint')
+        def unpin_after_rollback_to_savepoint(connection, name, context):
+            connection.info.pop('schema', None)
+            unpin_schema(connection.info)
+
+        @event.listens_for(engine, 'reset')
+        def unpin_after_reset(dbapi_connection, record):
+            # the transaction was neither committed nor rolled back through
+            # sqlalchemy when the connection is returned
+            unpin_schema(record.info)
+
+        @event.listens_for(engine, 'connect')
+        def limit_session_lifetime(dbapi_connection, record):
+            """ Kills idle sessions after a while, freeing up memory. """
+
+            cursor = dbapi_connection.cursor()
+            cursor.execute(
+                "SET SESSION idle_in_transaction_session_timeout = %s",
+                (f'{CONNECTION_LIFETIME}s', )
+            )
+            cursor.close()
+            dbapi_connection.commit()
@@ -0,0 +1,121 @@
+""" Prewarms the caches of many towns in parallel, e.g. after a release, so
+the first visitor of each town doesn't have to wait for them.
+
+The towns are prewarmed by short-lived worker processes, so only the caches
+which outlast them are warmed:
+
+* The orm cached properties (e.g. the organisation), which are kept in the
+  application cache shared by all processes (see
+  :mod:`onegov.core.orm.cache`).
+* The precompiled translations of the languages used by each town, which
+  are written to disk (see :mod:`onegov.town.i18n`).
+* The buffers of the database, which are filled by the queries above.
+
+The themes are compiled beforehand (see :mod:`onegov.town.theme.precompile`).
+
+The caches of each web process (e.g. the homepage templates or the loaded
+translations) are not warmed, they are filled by the first request handled
+by each process.
+
+"""
+
+import inspect
+import time
+import transaction
+
+from collections import namedtuple
+from multiprocessing import Pool
+from onegov.core.orm.cache import OrmCacheDescriptor
+from onegov.core.utils import scan_morepath_modules
+
+
+#: the outcome of prewarming a single town
+PrewarmResult = namedtuple(
+    'PrewarmResult', ('application_id', 'duration', 'error'))
+
+
+def prewarm_applications(app_class, namespace, configuration, application_ids,
+                         processes=None):
+    """ Prewarms the caches of the given applications, using a pool of
+    processes. Yields a :class:`PrewarmResult` for each application, as
+    soon as it is done.
+
+    :param app_class:
+        The application class (e.g. :class:`onegov.town.TownApp`).
+
+    :param namespace:
+        The namespace of the application (e.g. 'onegov_town').
+
+    :param configuration:
+        The configuration passed to the application.
+
+    :param application_ids:
+        The application ids (including the namespace).
+
+    :param processes:
+        The number of towns prewarmed at the same time.
+
+    """
+
+    initargs = (app_class, namespace, configuration)
+
+    with Pool(processes, initializer=setup_worker, initargs=initargs) as pool:
+        yield from pool.imap_unordered(prewarm_application, application_ids)
+
+
+#: the application instance of a prewarming worker process
+worker_app = None
+
+
+def setup_worker(app_class, namespace, configuration):
+    """ Sets up the application instance of a prewarming worker process. """
+
+    global worker_app
+
+    scan_morepath_modules(app_class)
+    app_class.commit()
+
+    worker_app = app_class()
+    worker_app.namespace = namespace
+    worker_app.configure_application(**configuration)
+
+
+def prewarm_application(application_id):
+    """ Prewarms a single town, used by :func:`prewarm_applications`.
+
+    Errors are not raised, but returned as part of the result.
+
+    """
+
+    start = time.perf_counter()
+
+    try:
+        worker_app.set_application_id(application_id)
+        worker_app.clear_request_cache()
+
+        prewarm(worker_app)
+    except Exception as e:
+        error = f'{e.__class__.__name__}: {e}'
+    else:
+        error = None
+    finally:
+        transaction.abort()
+
+    return PrewarmResult(application_id, time.perf_counter() - start, error)
+
+
+def prewarm(app):
+    """ Prewarms the caches of the current application of the given app. """
+
+    for name, member in inspect.getmembers(app.__class__):
+        if isinstance(member, OrmCacheDescriptor):
+            getattr(app, name)
+
+    locales = app.org.locales or ()
+
+    if isinstance(locales, str):
+        locales = (locales, )
+
+    # compiles the translations, which are then loaded from disk
+    for locale in locales:
+        app.translations.get(locale)
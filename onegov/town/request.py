@@ -0,0 +1,56 @@
+from cached_property import cached_property
+from morepath import Request
+from morepath.request import SAME_APP
+from onegov.core.static import StaticFile
+from onegov.org.request import OrgRequest
+from onegov.town.assets import find_static_file, fingerprint
+
+
+class TownRequest(OrgRequest):
+
+    #: the timings of the homepage widgets, collected if the widgets are
+    #: measured (see :mod:`onegov.town.widget_metrics`)
+    widget_timings = None
+
+    @cached_property
+    def virtual_base_url(self):
+        """ The url of the application as seen by the client, taking the
+        virtual hosting into account (see :meth:`transform`). All absolute
+        links generated for this request start with it.
+
+        """
+        return self.transform(self.link_prefix())
+
+    def link(self, obj, name='', default=None, app=SAME_APP):
+        """ Extends the link generating function of onegov.core, by using
+        the hash of the content of static files as their version, instead of
+        the version of the application (see :mod:`onegov.town.assets`).
+
+        """
+        if isinstance(obj, StaticFile) and obj.version and app is SAME_APP:
+            path = find_static_file(self.app, obj.path)
+
+            if path:
+                obj = StaticFile(obj.path, version=fingerprint(path))
+
+        return super().link(obj, name, default, app)
+
+    def class_link(self, model, variables=None, name='', app=SAME_APP):
+        """ Extends the class link generating function of onegov.core, by
+        caching the links to classes without variables (e.g. collections).
+
+        Those links only depend on the application base path, so they are
+        resolved once per application (see :attr:`TownApp.class_links`).
+        The host is added for each request, as before.
+
+        """
+        if variables or app is not SAME_APP:
+            return super().class_link(model, variables, name, app)
+
+        key = (model, name, self.link_prefix())
+        links = self.app.class_links
+
+        if key not in links:
+            links[key] = Request.class_link(self, model, name=name)
+
+        return self.transform(links[key])
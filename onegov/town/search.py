@@ -0,0 +1,455 @@
+""" Indexes the changes of each transaction in bulk, instead of sending one
+request to elasticsearch per changed document.
+
+onegov.search translates every insert, update and delete of a searchable
+object into an indexing task and sends each task on its own (an update even
+results in two requests). Provisioning a town or editing many pages thus
+results in hundreds of requests.
+
+Here, the tasks of a transaction are collected until the transaction is
+committed. Tasks of aborted transactions and of savepoints which are rolled
+back are dropped. On commit, the tasks
+are reduced to the last state of each document and queued. The queue is
+then sent to elasticsearch using bulk requests of up to ``batch_size``
+documents.
+
+The batches are configured through the application config::
+
+    elasticsearch_batch_size: 100      # documents per bulk request
+    elasticsearch_flush_interval: 0    # seconds between bulk requests
+
+By default, the queue is flushed after each commit. With a flush interval,
+the tasks of multiple transactions are sent together, once there are enough
+tasks to fill a batch or once the interval has passed. This trades the
+freshness of the search results for fewer requests.
+
+Note that there's no timer involved - the interval is only checked on the
+next commit (or request) of the process. A process which goes quiet keeps
+its queued tasks until it becomes active again, or until the queue is
+flushed explicitly (e.g. by the reindexing).
+
+"""
+
+import threading
+import time
+import transaction
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from elasticsearch.exceptions import NotFoundError
+from onegov.search import log, utils
+from onegov.search.errors import SearchOfflineError
+from onegov.search.indexer import Indexer, ORMEventTranslator
+from queue import Empty
+from weakref import WeakKeyDictionary
+
+
+def task_key(task):
+    return task['schema'], task['type_name'], task['id']
+
+
+def collapse_tasks(tasks):
+    """ Reduces the given tasks to the fewest tasks leading to the same
+    result, keeping the order of the documents.
+
+    * Documents which existed before (their first task is a delete) are
+      deleted once.
+    * Documents which exist afterwards (their last task is an index) are
+      indexed once, with their last properties.
+
+    A document added and removed again results in no task at all.
+
+    """
+
+    by_document = OrderedDict()
+
+    for task in tasks:
+        by_document.setdefault(task_key(task), []).append(task)
+
+    for document_tasks in by_document.values():
+        first, last = document_tasks[0], document_tasks[-1]
+
+        if first['action'] == 'delete':
+            yield first
+
+        if last['action'] == 'index':
+            yield last
+
+
+class BatchedORMEventTranslator(ORMEventTranslator):
+    """ Collects the indexing tasks of each transaction and queues them once
+    the transaction is committed.
+
+    Tasks created outside of the orm events (e.g. by the reindexing) are
+    queued right away.
+
+    :param after_commit:
+        A callable invoked after the tasks of a transaction have been
+        queued (e.g. to flush the queue).
+
+    """
+
+    def __init__(self, *args, after_commit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.after_commit = after_commit
+        self.pending = WeakKeyDictionary()
+        self.local = threading.local()
+
+    def on_insert(self, schema, obj):
+        with self.buffered():
+            super().on_insert(schema, obj)
+
+    def on_update(self, schema, obj):
+        with self.buffered():
+            super().on_update(schema, obj)
+
+    def on_delete(self, schema, obj):
+        with self.buffered():
+            super().on_delete(schema, obj)
+
+    @contextmanager
+    def buffered(self):
+        """ Collects the tasks put into the translator while active, to be
+        queued with the current transaction.
+
+        """
+        self.local.tasks = self.transaction_tasks()
+
+        try:
+            yield
+        finally:
+            self.local.tasks = None
+
+    def transaction_tasks(self):
+        """ Returns the list of tasks of the current transaction. """
+
+        txn = transaction.get()
+
+        if txn not in self.pending:
+            self.pending[txn] = TransactionTasks()
+            txn.addAfterCommitHook(self.on_commit, args=(txn, ))
+
+        self.pending[txn].join(txn)
+
+        return self.pending[txn].tasks
+
+    def put(self, translation):
+        tasks = getattr(self.local, 'tasks', None)
+
+        if tasks is None:
+            super().put(translation)
+        else:
+            tasks.append(translation)
+
+    def on_commit(self, success, txn):
+        pending = self.pending.pop(txn, None)
+        tasks = pending.tasks if pending else ()
+
+        if not success:
+            return
+
+        for task in collapse_tasks(tasks):
+            super().put(task)
+
+        if tasks and self.after_commit:
+            self.after_commit()
+
+
+class TransactionTasks(object):
+    """ Holds the tasks of a transaction. Joins the transaction as data
+    manager, to drop the tasks recorded inside savepoints which are rolled
+    back.
+
+    Committing is left to the after commit hook of the translator.
+
+    """
+
+    transaction_manager = transaction.manager
+
+    def __init__(self):
+        self.tasks = []
+        self.joined = False
+
+    def join(self, txn):
+        if self.joined:
+            return
+
+        try:
+            txn.join(self)
+        except ValueError:
+            # the transaction is being committed, it's too late for
+            # savepoints anyway
+            return
+
+        self.joined = True
+
+    def savepoint(self):
+        return TaskSavepoint(self.tasks)
+
+    def sortKey(self):
+        return 'onegov.town.search'
+
+    def abort(self, txn):
+        # called when the transaction is aborted or when a savepoint taken
+        # before we joined is rolled back (which unjoins us)
+        del self.tasks[:]
+        self.joined = False
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        pass
+
+    def tpc_vote(self, txn):
+        pass
+
+    def tpc_finish(self, txn):
+        pass
+
+    def tpc_abort(self, txn):
+        pass
+
+
+class TaskSavepoint(object):
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.length = len(tasks)
+
+    def rollback(self):
+        del self.tasks[self.length:]
+
+
+class BatchedIndexer(Indexer):
+    """ Sends the queued tasks to elasticsearch using bulk requests.
+
+    The tasks are collapsed per document before they are sent, so a document
+    changed by multiple transactions is only indexed once.
+
+    If elasticsearch can't be reached, the batch is kept and sent again on
+    the next flush.
+
+    :param batch_size:
+        The maximum number of documents sent per request.
+
+    :param flush_interval:
+        The number of seconds after which the queue is flushed. Until then,
+        the queue is only flushed by :meth:`process` once it holds a full
+        batch. Defaults to 0, which flushes on every call to :meth:`process`.
+
+        The interval is only checked when :meth:`process` is called, there
+        is no timer flushing the queue in the background.
+
+    :param backend:
+        The backend the batches are sent to. Defaults to
+        :class:`ElasticsearchBackend`.
+
+    """
+
+    def __init__(self, mappings, queue, es_client, hostname=None,
+                 batch_size=100, flush_interval=0, backend=None):
+        super().__init__(mappings, queue, es_client, hostname=hostname)
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backend = backend or ElasticsearchBackend(self)
+        self.failed_batch = None
+        self.last_flush = time.monotonic()
+
+    @property
+    def is_due(self):
+        if self.queue.qsize() >= self.batch_size:
+            return True
+
+        if not self.failed_batch and self.queue.empty():
+            return False
+
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def process(self, block=False, timeout=None):
+        """ Flushes the queue, if it's due. Unlike the indexer of
+        onegov.search, this never blocks.
+
+        :return: The number of successfully processed tasks
+
+        """
+
+        if not self.is_due:
+            return 0
+
+        return self.flush()
+
+    def bulk_process(self):
+        """ Flushes the queue, used by the reindexing. """
+
+        self.flush()
+
+    def flush(self):
+        """ Sends all queued tasks using bulk requests, until the queue is
+        empty or until elasticsearch can't be reached.
+
+        :return: The number of successfully processed tasks
+
+        """
+
+        self.last_flush = time.monotonic()
+        processed = 0
+
+        while self.failed_batch or not self.queue.empty():
+            batch = self.failed_batch or self.next_batch()
+            self.failed_batch = None
+
+            if not batch:
+                continue
+
+            try:
+                self.backend.bulk(batch)
+            except SearchOfflineError:
+                # keep the batch for the next run and give up
+                self.failed_batch = batch
+                return processed
+
+            processed += len(batch)
+
+        return processed
+
+    def next_batch(self):
+        """ Takes up to ``batch_size`` documents from the queue and returns
+        their collapsed tasks.
+
+        """
+
+        tasks = []
+        documents = set()
+
+        while len(documents) < self.batch_size:
+            try:
+                task = self.queue.get_nowait()
+            except Empty:
+                break
+
+            self.queue.task_done()
+            tasks.append(task)
+            documents.add(task_key(task))
+
+        return list(collapse_tasks(tasks))
+
+
+class ElasticsearchBackend(object):
+    """ Sends the batches to elasticsearch, one bulk request per batch. """
+
+    def __init__(self, indexer):
+        self.indexer = indexer
+
+    @property
+    def es_client(self):
+        return self.indexer.es_client
+
+    def bulk(self, tasks):
+        body = []
+        indices = {}
+
+        for task in tasks:
+            if task['action'] == 'index':
+                body.append({'index': {
+                    '_index': self.indexer.ensure_index(task),
+                    '_type': task['type_name'],
+                    '_id': task['id']
+                }})
+                body.append(task['properties'])
+
+            elif task['action'] == 'delete':
+                for index, type_name in self.deletion_targets(task, indices):
+                    body.append({'delete': {
+                        '_index': index,
+                        '_type': type_name,
+                        '_id': task['id']
+                    }})
+
+            else:
+                raise NotImplementedError
+
+        if body:
+            self.log_errors(self.es_client.bulk(body=body))
+
+    def deletion_targets(self, task, indices):
+        """ Yields the internal indices and types the given document might
+        be stored in (see :meth:`onegov.search.indexer.Indexer.delete`).
+
+        The indices are looked up once per type and batch.
+
+        """
+
+        mapping = self.indexer.mappings[task['type_name']]
+
+        if mapping.model:
+            types = utils.related_types(mapping.model)
+        else:
+            types = (mapping.name, )
+
+        for type_name in types:
+            key = (task['schema'], type_name)
+
+            if key not in indices:
+                indices[key] = self.internal_indices(*key)
+
+            for index in indices[key]:
+                yield index, type_name
+
+    def internal_indices(self, schema, type_name):
+        external = self.indexer.ixmgr.get_external_index_name(
+            schema=schema,
+            language='*',
+            type_name=type_name
+        )
+
+        try:
+            return tuple(self.es_client.indices.get_alias(index=external))
+        except NotFoundError:
+            return ()
+
+    def log_errors(self, response):
+        if not response.get('errors'):
+            return
+
+        for item in response['items']:
+            for action, result in item.items():
+
+                # documents to delete may not have been indexed before
+                if action == 'delete' and result.get('status') == 404:
+                    continue
+
+                if 'error' in result:
+                    log.error("Failed to {} {}/{}: {}".format(
+                        action, result.get('_index'), result.get('_id'),
+                        result['error']
+                    ))
+
+
+class MemoryBackend(object):
+    """ Keeps the indexed documents in memory, as a stand-in for
+    elasticsearch in tests.
+
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.requests = 0
+
+    def bulk(self, tasks):
+        self.requests += 1
+
+        for task in tasks:
+            key = task_key(task)
+
+            if task['action'] == 'index':
+                self.documents[key] = task['properties']
+            else:
+                self.documents.pop(key, None)
+
+    def ids(self, schema, type_name):
+        return {
+            id for s, t, id in self.documents if (s, t) == (schema, type_name)
+        }
@@ -0,0 +1,129 @@
+""" Provides a content-addressed depot storage, which stores identical files
+only once, even if they are used by many tenants.
+
+This is mostly useful for the images of the initial content, which would
+otherwise be stored (together with their thumbnails) once per town.
+
+Note that this saves disk space, not processing time: The files are only
+deduplicated once they are stored, so onegov.file still calculates the
+checksum, the image size and the thumbnails of each file of each town.
+
+"""
+
+import hashlib
+import os
+import threading
+
+from depot.io.local import LocalFileStorage
+
+
+class DeduplicatingFileStorage(LocalFileStorage):
+    """ A local file storage which replaces each stored file with a hard
+    link to a blob named after the sha-256 digest of its content.
+
+    The blobs are stored in a directory shared by all tenants (next to the
+    storage paths of the tenants by default). The files of all tenants
+    point to the same blob, as long as they have the same content. Removing
+    a file only removes the link of the tenant, the blob is removed with the
+    last file linking to it.
+
+    Since hard links are used, the blobs have to be stored on the same file
+    system as the files.
+
+    """
+
+    def __init__(self, storage_path, blob_path=None):
+        super().__init__(storage_path)
+
+        self.blob_path = blob_path or os.path.join(
+            os.path.dirname(os.path.abspath(storage_path)), '.blobs')
+
+    def create(self, content, filename=None, content_type=None):
+        file_id = super().create(content, filename, content_type)
+        self.deduplicate(file_id)
+
+        return file_id
+
+    def replace(self, file_or_id, content, filename=None, content_type=None):
+        file_id = super().replace(file_or_id, content, filename, content_type)
+        self.deduplicate(file_id)
+
+        return file_id
+
+    def delete(self, file_or_id):
+        path = os.path.join(self.storage_path, self.fileid(file_or_id), 'file')
+        blob = self.linked_blob(path)
+
+        super().delete(file_or_id)
+
+        if not blob:
+            return
+
+        # remove the blob once no other file links to it
+        try:
+            if os.stat(blob).st_nlink == 1:
+                os.unlink(blob)
+        except FileNotFoundError:
+            pass
+
+    def linked_blob(self, path):
+        """ Returns the path of the blob the file at the given path links to,
+        or None.
+
+        """
+        try:
+            blob = self.blob(path)
+            linked = os.path.samefile(path, blob)
+        except FileNotFoundError:
+            return None
+
+        return blob if linked else None
+
+    def blob(self, path):
+        """ Returns the path of the blob for the file at the given path. """
+
+        digest = hashlib.sha256()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+
+        digest = digest.hexdigest()
+        return os.path.join(self.blob_path, digest[:2], digest)
+
+    def deduplicate(self, file_id):
+        path = os.path.join(self.storage_path, file_id, 'file')
+        blob = self.blob(path)
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+        # the blob might be removed by another process in between
+        while True:
+            try:
+                os.link(path, blob)
+                return
+            except FileExistsError:
+                pass
+
+            try:
+                self.link_to_blob(path, blob)
+                return
+            except FileNotFoundError:
+                pass
+
+    def link_to_blob(self, path, blob):
+        """ Replaces the file at the given path with a link to the given
+        blob, atomically.
+
+        """
+        if os.path.samefile(path, blob):
+            return
+
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        # left over by a process which crashed
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+        os.link(blob, temp)
+        os.replace(temp, path)
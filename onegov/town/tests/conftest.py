@@ -3,12 +3,13 @@ import onegov.town
 import pytest
 import transaction
 
-from onegov.core.utils import module_path
+from io import BytesIO
 from onegov_testing.utils import create_app
 from onegov.town import TownApp
-from onegov.town.initial_content import builtin_form_definitions
+from onegov.town.builtin_forms import builtin_forms
 from onegov.town.initial_content import create_new_organisation
 from onegov.user import User
+from zope.sqlalchemy import mark_changed
 
 
 @pytest.yield_fixture(scope='session')
@@ -19,13 +20,22 @@ def handlers():
 
 @pytest.yield_fixture(scope='session')
 def forms():
-    yield list(builtin_form_definitions(
-        module_path('onegov.town', 'forms/builtin')))
+    yield builtin_forms('de_CH')
+
+
+@pytest.fixture(scope='session')
+def town_snapshot():
+    """ Holds the content of the town created by the first test using
+    :func:`town_app`, which is restored for all other tests.
+
+    """
+    return {}
 
 
 @pytest.yield_fixture(scope='function')
-def town_app(request):
-    yield create_town_app(request, use_elasticsearch=False)
+def town_app(request, town_snapshot):
+    yield create_town_app(
+        request, use_elasticsearch=False, snapshot=town_snapshot)
 
 
 @pytest.yield_fixture(scope='function')
@@ -33,8 +43,20 @@ def es_town_app(request):
     yield create_town_app(request, use_elasticsearch=True)
 
 
-def create_town_app(request, use_elasticsearch):
+def create_town_app(request, use_elasticsearch, snapshot=None):
+    """ Creates a town app with the initial content and two users.
+
+    If a snapshot (a dictionary) is given, the content is restored from the
+    snapshot instead, if it has been created already. Otherwise it is
+    created and stored in the snapshot.
+
+    """
     app = create_app(TownApp, request, use_elasticsearch=False)
+
+    if snapshot:
+        restore_schema(app, snapshot)
+        return app
+
     session = app.session()
 
     forms = request.getfixturevalue('forms')
@@ -58,6 +80,83 @@ def create_town_app(request, use_elasticsearch):
     ))
 
     transaction.commit()
+
+    if snapshot is not None:
+        snapshot.update(dump_schema(app))
+
     session.close_all()
 
     return app
+
+
+def dump_schema(app):
+    """ Returns the content of all tables and sequences of the current
+    schema of the given app.
+
+    """
+    session = app.session()
+    schema = app.schema
+
+    tables = [r[0] for r in session.execute(
+        "SELECT tablename FROM pg_tables WHERE schemaname = :schema",
+        {'schema': schema}
+    )]
+
+    sequences = [r[0] for r in session.execute(
+        "SELECT sequence_name FROM information_schema.sequences "
+        "WHERE sequence_schema = :schema",
+        {'schema': schema}
+    )]
+
+    cursor = session.connection().connection.cursor()
+    snapshot = {'tables': {}, 'sequences': {}}
+
+    for table in tables:
+        data = BytesIO()
+        cursor.copy_expert(
+            f'COPY "{schema}"."{table}" TO STDOUT WITH (FORMAT binary)', data)
+        snapshot['tables'][table] = data.getvalue()
+
+    for sequence in sequences:
+        snapshot['sequences'][sequence] = tuple(session.execute(
+            f'SELECT last_value, is_called FROM "{schema}"."{sequence}"'
+        ).first())
+
+    transaction.abort()
+    return snapshot
+
+
+def restore_schema(app, snapshot):
+    """ Restores the content of the given snapshot (see
+    :func:`dump_schema`) into the current schema of the given app.
+
+    This is much faster than creating the content, as the data is copied
+    into the tables directly, without checking the foreign keys.
+
+    """
+    session = app.session()
+    schema = app.schema
+
+    session.execute("SET LOCAL session_replication_role = replica")
+    session.execute('TRUNCATE {}'.format(', '.join(
+        f'"{schema}"."{table}"' for table in snapshot['tables']
+    )))
+
+    cursor = session.connection().connection.cursor()
+
+    for table, data in snapshot['tables'].items():
+        cursor.copy_expert(
+            f'COPY "{schema}"."{table}" FROM STDIN WITH (FORMAT binary)',
+            BytesIO(data))
+
+    for sequence, (value, is_called) in snapshot['sequences'].items():
+        session.execute(
+            "SELECT setval(:sequence, :value, :is_called)", {
+                'sequence': f'"{schema}"."{sequence}"',
+                'value': value,
+                'is_called': is_called
+            })
+
+    mark_changed(session)
+    transaction.commit()
+    session.close_all()
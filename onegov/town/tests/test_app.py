@@ -0,0 +1,171 @@
+import transaction
+
+from datetime import date, datetime, time, timedelta
+
+from dogpile.cache.api import NO_VALUE
+from onegov.core.utils import module_path
+from onegov.event import OccurrenceCollection
+from onegov.form import FormCollection
+from onegov.org.models import GeneralFileCollection
+from onegov.reservation import ResourceCollection
+from onegov.town import TownApp
+from webob.request import BaseRequest
+
+
+def test_resources_by_name(town_app):
+    assert town_app.resources_by_name(('foo', 'bar')) == []
+
+    daypass, = town_app.resources_by_name(('ga-tageskarte', 'sbb-tageskarte'))
+    assert daypass.name == 'sbb-tageskarte'
+
+    resources = ResourceCollection(town_app.libres_context)
+    resources.add("GA-Tageskarte", 'Europe/Zurich', type='daypass')
+    transaction.commit()
+
+    names = [r.name for r in town_app.resources_by_name(
+        ('ga-tageskarte', 'foo', 'sbb-tageskarte'))]
+
+    assert names == ['ga-tageskarte', 'sbb-tageskarte']
+
+    resources.by_name('ga-tageskarte').name = 'gemeinde-tageskarte'
+    transaction.commit()
+
+    names = [r.name for r in town_app.resources_by_name(
+        ('ga-tageskarte', 'foo', 'sbb-tageskarte'))]
+
+    assert names == ['sbb-tageskarte']
+
+
+def test_daypass_availability(town_app):
+    daypass, = town_app.resources_by_name(('sbb-tageskarte', ))
+    assert town_app.daypass_availability(daypass) == {}
+    assert town_app.daypasses_left_today(daypass) is None
+
+    today = date.today()
+    later = today + timedelta(days=10)
+    never = today + timedelta(weeks=5)
+
+    scheduler = daypass.get_scheduler(town_app.libres_context)
+    scheduler.allocate(
+        dates=[
+            (datetime.combine(d, time()), datetime.combine(d, time()))
+            for d in (today, later, never)
+        ],
+        whole_day=True,
+        quota=3
+    )
+    transaction.commit()
+
+    daypass, = town_app.resources_by_name(('sbb-tageskarte', ))
+    assert town_app.daypass_availability(daypass) == {today: 3, later: 3}
+    assert town_app.daypasses_left_today(daypass) == 3
+
+    stats = town_app.__class__.daypass_cache.stats
+    before = stats.copy()
+
+    town_app.daypass_availability(daypass)
+    assert stats['hits'] - before['hits'] == 1
+
+    # approved reservations are no longer available
+    start = datetime.combine(today, time())
+    scheduler = daypass.get_scheduler(town_app.libres_context)
+    scheduler.approve_reservations(
+        scheduler.reserve('info@example.org', (start, start), quota=2))
+    transaction.commit()
+
+    assert stats['invalidations'] > before['invalidations']
+
+    daypass, = town_app.resources_by_name(('sbb-tageskarte', ))
+    assert town_app.daypasses_left_today(daypass) == 1
+    assert town_app.daypass_availability(daypass, weeks=6) \
+        == {today: 1, later: 3, never: 3}
+
+
+def test_has_publications(town_app):
+    assert not town_app.has_publications
+
+    session = town_app.session()
+    path = module_path('onegov.org', 'tests/fixtures/sample.pdf')
+
+    # uploading other files doesn't evict the cache
+    with open(path, 'rb') as f:
+        GeneralFileCollection(session).add(filename='sample.pdf', content=f)
+
+    transaction.commit()
+
+    assert town_app.cache.get('TownApp.has_publications') is not NO_VALUE
+    assert not town_app.has_publications
+
+    # signing the file publishes it
+    files = GeneralFileCollection(session)
+    files.query().one().signed = True
+    transaction.commit()
+
+    assert town_app.has_publications
+
+    files.query().one().published = False
+    transaction.commit()
+
+    assert not town_app.has_publications
+
+    files.query().one().published = True
+    transaction.commit()
+
+    assert town_app.has_publications
+
+    files.delete(files.query().one())
+    transaction.commit()
+
+    assert not town_app.has_publications
+
+
+def test_org_snapshot(town_app):
+    stats = TownApp.org.stats
+
+    town_app.org
+    town_app.clear_request_cache()
+
+    hits, misses = stats['hits'], stats['misses']
+    assert town_app.org.name == 'Govikon'
+    assert (stats['hits'], stats['misses']) == (hits + 1, misses)
+
+    # changes to the organisation load it again
+    town_app.org.name = 'Gemeinde Govikon'
+    transaction.commit()
+    town_app.clear_request_cache()
+
+    assert town_app.org.name == 'Gemeinde Govikon'
+    assert stats['misses'] == misses + 1
+
+    # changes which are not committed do not end up in the snapshot
+    town_app.org.meta['hide_publications'] = True
+    transaction.abort()
+    town_app.clear_request_cache()
+
+    assert 'hide_publications' not in town_app.org.meta
+    assert stats['misses'] == misses + 1
+
+
+def test_class_links(town_app):
+
+    def request(url):
+        environ = BaseRequest.blank('/', base_url=url).environ
+        return town_app.request_class(environ=environ, app=town_app)
+
+    link = request('https://govikon.ch').class_link(FormCollection)
+    assert link.startswith('https://govikon.ch/')
+    assert link.endswith('/forms')
+    assert len(town_app.class_links) == 1
+
+    # the host is not cached
+    link = request('http://localhost').class_link(FormCollection)
+    assert link.startswith('http://localhost/')
+    assert link.endswith('/forms')
+    assert len(town_app.class_links) == 1
+
+    # links with variables are not cached
+    link = request('https://govikon.ch').class_link(
+        OccurrenceCollection, {'page': 1})
+
+    assert 'page=1' in link
+    assert len(town_app.class_links) == 1
@@ -0,0 +1,66 @@
+import os
+
+from onegov.town.assets import compress_directory, fingerprint, serve_file
+from webob import Request
+
+
+def test_compress_directory(tmpdir):
+    tmpdir.join('site.css').write('body { color: red; }\n' * 100)
+    tmpdir.join('small.css').write('body { color: red; }\n')
+    tmpdir.join('image.png').write('png' * 1000)
+
+    written = list(compress_directory(str(tmpdir)))
+    assert str(tmpdir.join('site.css.gz')) in written
+    assert not tmpdir.join('small.css.gz').exists()
+    assert not tmpdir.join('image.png.gz').exists()
+
+    # existing variants are only written again if forced
+    assert not list(compress_directory(str(tmpdir)))
+    assert list(compress_directory(str(tmpdir), force=True))
+
+
+def test_serve_file(tmpdir):
+    path = tmpdir.join('site.css')
+    path.write('body { color: red; }\n' * 100)
+    path = str(path)
+
+    def get(**headers):
+        return serve_file(Request.blank('/', headers=headers), path)
+
+    etag = fingerprint(path)
+
+    response = get(**{'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.etag == etag
+    assert response.content_encoding is None
+    assert response.cache_control.no_cache
+    assert len(response.body) == 2100
+
+    list(compress_directory(str(tmpdir)))
+
+    response = get(**{'Accept-Encoding': 'gzip'})
+    assert response.etag == f'{etag}-gzip'
+    assert response.content_encoding == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert len(response.body) < 2100
+
+    # without accept encoding header, the file itself is sent
+    assert get().content_encoding is None
+
+    response = get(**{'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert not response.body
+
+    response = get(**{'If-None-Match': f'"{etag}"', 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+
+    # outdated variants are ignored
+    with open(path, 'a') as f:
+        f.write('a { color: blue; }\n' * 10)
+
+    mtime = os.stat(path + '.gz').st_mtime + 1
+    os.utime(path, (mtime, mtime))
+
+    response = get(**{'Accept-Encoding': 'gzip'})
+    assert response.content_encoding is None
+    assert response.etag != etag
@@ -0,0 +1,64 @@
+import transaction
+
+from onegov.core.upgrade import get_tasks, get_upgrade_modules, UpgradeState
+from onegov.town import batch_upgrade
+from onegov.town.batch_upgrade import upgrade_application
+
+
+def test_upgrade_application(town_app, monkeypatch):
+    tasks = tuple((i, t) for i, t in get_tasks() if not t.raw)
+
+    monkeypatch.setattr(batch_upgrade, 'worker_app', town_app)
+    monkeypatch.setattr(batch_upgrade, 'worker_tasks', tasks)
+    monkeypatch.setattr(
+        batch_upgrade, 'worker_modules', list(get_upgrade_modules()))
+
+    application_id = town_app.application_id
+
+    # all tasks are marked as executed for new applications
+    result = upgrade_application(application_id)
+    assert result.application_id == application_id
+    assert not result.error
+
+    def pending():
+        state = town_app.session().query(UpgradeState)\
+            .filter_by(module='onegov.town').one()
+
+        state.state['executed_tasks'].remove(
+            'Install updated homepage structure')
+        state.state.changed()
+        transaction.commit()
+
+    def executed():
+        town_app.set_application_id(application_id)
+        state = town_app.session().query(UpgradeState)\
+            .filter_by(module='onegov.town').one()
+
+        return set(state.state['executed_tasks'])
+
+    pending()
+
+    # dry-runs roll back the changes
+    monkeypatch.setattr(batch_upgrade, 'worker_commit', False)
+    result = upgrade_application(application_id)
+    assert 'Install updated homepage structure' in result.tasks
+    assert 'Install updated homepage structure' not in executed()
+
+    monkeypatch.setattr(batch_upgrade, 'worker_commit', True)
+    result = upgrade_application(application_id)
+    assert 'Install updated homepage structure' in result.tasks
+    assert 'Install updated homepage structure' in executed()
+
+    # once upgraded, the application is skipped
+    result = upgrade_application(application_id)
+    assert 'Install updated homepage structure' not in result.tasks
+
+    # a town which can't be set up fails on its own
+    def broken(application_id):
+        raise RuntimeError("Broken configuration")
+
+    monkeypatch.setattr(town_app, 'set_application_id', broken)
+
+    result = upgrade_application(application_id)
+    assert result.error == 'RuntimeError: Broken configuration'
+    assert not result.tasks
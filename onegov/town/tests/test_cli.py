@@ -0,0 +1,33 @@
+import os
+import yaml
+
+from click.testing import CliRunner
+from onegov.town.cli import cli
+
+
+def test_org_command(postgres_dsn, temporary_directory):
+    cfg = {
+        'applications': [
+            {
+                'path': '/town/*',
+                'application': 'onegov.town.TownApp',
+                'namespace': 'town',
+                'configuration': {
+                    'dsn': postgres_dsn,
+                    'depot_backend': 'depot.io.memory.MemoryFileStorage'
+                }
+            }
+        ]
+    }
+
+    cfg_path = os.path.join(temporary_directory, 'onegov.yml')
+
+    with open(cfg_path, 'w') as f:
+        f.write(yaml.dump(cfg))
+
+    # the commands of onegov.org are found through the town cli
+    result = CliRunner().invoke(cli, [
+        '--config', cfg_path, '--select', '/town/newyork', 'add', 'New York'
+    ])
+
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,124 @@
+import pytest
+import transaction
+
+from datetime import date, datetime, timedelta
+from io import StringIO
+from onegov.event import EventCollection, OccurrenceCollection
+from onegov.town.event_import import get_event_reader, import_events
+from onegov.town.event_import import read_csv, read_events, read_ical
+from onegov.town.event_import import read_yaml
+from pytz import UTC
+
+
+def test_get_event_reader():
+    assert get_event_reader('events.yml') is read_yaml
+    assert get_event_reader('events.yaml') is read_yaml
+    assert get_event_reader('events.csv') is read_csv
+    assert get_event_reader('events.ics') is read_ical
+
+    with pytest.raises(ValueError):
+        get_event_reader('events.xlsx')
+
+
+def test_read_yaml():
+    events = list(read_yaml(StringIO(
+        "title: Party\n"
+        "start: 2019-01-01 10:00\n"
+        "end: 2019-01-01 12:00\n"
+        "tags: [Music, Party]\n"
+        "---\n"
+        "title: Market\n"
+        "start: 2019-07-01\n"
+        "end: 2019-07-01\n"
+        "source: market\n"
+    )))
+
+    assert events[0]['title'] == 'Party'
+    assert events[0]['start'] == datetime(2019, 1, 1, 9, tzinfo=UTC)
+    assert events[0]['end'] == datetime(2019, 1, 1, 11, tzinfo=UTC)
+    assert events[0]['timezone'] == 'Europe/Zurich'
+    assert events[0]['tags'] == ['Music', 'Party']
+    assert events[0]['source'] is None
+
+    assert events[1]['start'] == datetime(2019, 6, 30, 22, tzinfo=UTC)
+    assert events[1]['end'] == datetime(2019, 7, 1, 21, 59, tzinfo=UTC)
+    assert events[1]['tags'] == []
+    assert events[1]['source'] == 'market'
+
+    with pytest.raises(ValueError):
+        list(read_yaml(StringIO("title: Party\nstart: 2019-01-01\n")))
+
+    with pytest.raises(ValueError):
+        list(read_yaml(StringIO(
+            "title: Party\nstart: 2019-01-01\nend: 2019-01-01\nfoo: bar\n")))
+
+
+def test_read_csv():
+    event, = read_csv(StringIO(
+        "title,start,end,location,tags\n"
+        "Party,2019-01-01T10:00+00:00,2019-01-01T12:00,Hall,\"Music, Party\"\n"
+    ))
+
+    assert event['start'] == datetime(2019, 1, 1, 10, tzinfo=UTC)
+    assert event['end'] == datetime(2019, 1, 1, 11, tzinfo=UTC)
+    assert event['location'] == 'Hall'
+    assert event['tags'] == ['Music', 'Party']
+    assert event['recurrence'] is None
+
+
+def test_read_ical():
+    event, = read_ical(StringIO(
+        "BEGIN:VCALENDAR\r\n"
+        "VERSION:2.0\r\n"
+        "BEGIN:VEVENT\r\n"
+        "UID:party@example.org\r\n"
+        "SUMMARY:Par\r\n"
+        " ty\r\n"
+        "DTSTART:20190101T100000Z\r\n"
+        "DURATION:PT2H\r\n"
+        "CATEGORIES:Music,Party\r\n"
+        "RRULE:FREQ=WEEKLY;UNTIL=20190201T000000Z\r\n"
+        "END:VEVENT\r\n"
+        "END:VCALENDAR\r\n"
+    ))
+
+    assert event['title'] == 'Party'
+    assert event['start'] == datetime(2019, 1, 1, 10, tzinfo=UTC)
+    assert event['end'] == datetime(2019, 1, 1, 12, tzinfo=UTC)
+    assert event['tags'] == ['Music', 'Party']
+    assert event['recurrence'] == 'RRULE:FREQ=WEEKLY;UNTIL=20190201T000000Z'
+    assert event['source'] == 'ical-party@example.org'
+
+
+def test_import_events(town_app, tmpdir):
+    start = date.today() + timedelta(days=1)
+    until = start + timedelta(days=15)
+
+    path = tmpdir.join('events.csv')
+    path.write('\n'.join((
+        'title,start,end,recurrence',
+        f'Concert,{start}T20:00,{start}T22:00,',
+        f'Concert,{start}T20:00,{start}T22:00,',
+        f'Gymnastics,{start}T10:00,{start}T11:00,'
+        f'RRULE:FREQ=WEEKLY;UNTIL={until:%Y%m%d}T000000Z',
+    )))
+
+    session = town_app.session()
+    existing = EventCollection(session).query().count()
+
+    assert import_events(session, read_events(str(path)), batch_size=2) \
+        == (3, 5)
+
+    transaction.commit()
+
+    events = EventCollection(session)
+    assert events.query().count() == existing + 3
+    assert events.by_name('concert').state == 'published'
+    assert events.by_name('concert-1').state == 'published'
+
+    gymnastics = events.by_name('gymnastics')
+    assert len(gymnastics.occurrences) == 3
+
+    occurrences = OccurrenceCollection(session).query().filter_by(
+        event_id=gymnastics.id)
+    assert occurrences.count() == 3
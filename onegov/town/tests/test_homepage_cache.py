@@ -0,0 +1,51 @@
+from onegov.town.homepage_cache import CachedResponse, HomepageCache
+
+
+def response(body):
+    return CachedResponse('200 OK', [('Content-Type', 'text/html')], body)
+
+
+def test_homepage_cache_lru():
+    cache = HomepageCache(max_size=10, shared=False)
+
+    cache.set('foo', 'de_CH', response(b'12345'))
+    cache.set('bar', 'de_CH', response(b'12345'))
+    assert cache.size == 10
+
+    # the least recently used entry is evicted
+    assert cache.get('foo', 'de_CH').body == b'12345'
+    cache.set('bar', 'fr_CH', response(b'123'))
+
+    assert cache.get('foo', 'de_CH')
+    assert cache.get('bar', 'de_CH') is None
+    assert cache.get('bar', 'fr_CH')
+    assert cache.size == 8
+
+    # responses larger than the cache are ignored
+    cache.set('foo', 'fr_CH', response(b'12345678901'))
+    assert cache.get('foo', 'fr_CH') is None
+
+    assert cache.stats['hits'] == 3
+    assert cache.stats['misses'] == 2
+
+
+def test_homepage_cache_expiration():
+    cache = HomepageCache(max_age=60, shared=False)
+    cache.set('foo', 'de_CH', CachedResponse('200 OK', [], b'', created=1))
+
+    assert cache.get('foo', 'de_CH') is None
+    assert cache.size == 0
+
+
+def test_homepage_cache_invalidate():
+    cache = HomepageCache(shared=False)
+    cache.set('foo', 'de_CH', response(b'foo'))
+    cache.set('foo', 'fr_CH', response(b'foo'))
+    cache.set('bar', 'de_CH', response(b'bar'))
+
+    cache.invalidate('foo')
+
+    assert cache.get('foo', 'de_CH') is None
+    assert cache.get('foo', 'fr_CH') is None
+    assert cache.get('bar', 'de_CH')
+    assert cache.stats['invalidations'] == 1
@@ -0,0 +1,33 @@
+from onegov.town.homepage_template import HomepageTemplateCache
+
+
+def test_homepage_template_cache(town_app):
+    cache = HomepageTemplateCache(max_size=2)
+    structure = town_app.org.meta['homepage_structure']
+
+    assert cache.get(town_app, None).body == ''
+    assert cache.stats['misses'] == 0
+
+    template = cache.get(town_app, structure)
+    assert cache.get(town_app, structure) is template
+    assert cache.stats == {'hits': 1, 'misses': 1}
+
+    # the template is shared with other tenants using the same structure
+    assert cache.get(town_app.__class__(), structure) is template
+    assert cache.stats == {'hits': 2, 'misses': 1}
+
+    cache.get(town_app, '<row><column span="12"><news /></column></row>')
+    cache.get(town_app, '<row><column span="12"><events /></column></row>')
+    assert cache.stats == {'hits': 2, 'misses': 3}
+
+    # the least recently used template is dropped
+    assert cache.get(town_app, structure) is not template
+    assert cache.stats == {'hits': 2, 'misses': 4}
+
+
+def test_homepage_template(town_app):
+    template = town_app.homepage_template
+
+    assert town_app.homepage_template is template
+    assert '<services' not in template.body
+    assert 'homepage' in template.body
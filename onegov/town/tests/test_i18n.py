@@ -0,0 +1,30 @@
+from onegov.core.i18n import get_translations
+from onegov.core.utils import module_path
+from onegov.town.i18n import LazyChameleonTranslations, LazyTranslations
+
+
+def test_lazy_translations(tmpdir):
+    localedirs = [
+        module_path('onegov.town', 'locale'),
+        module_path('onegov.org', 'locale')
+    ]
+
+    translations = LazyTranslations(localedirs, str(tmpdir))
+    assert set(translations) == {'de_CH', 'fr_CH'}
+    assert translations.get('en') is None
+    assert not translations.loaded
+    assert not tmpdir.listdir()
+
+    expected = get_translations(localedirs)
+    assert translations['de_CH']._catalog == expected['de_CH']._catalog
+    assert list(translations.loaded) == ['de_CH']
+    assert len(tmpdir.listdir()) == 1
+
+    # the compiled translations are reused by other processes
+    translations = LazyTranslations(localedirs, str(tmpdir))
+    assert translations['de_CH']._catalog == expected['de_CH']._catalog
+    assert translations['fr_CH']._catalog == expected['fr_CH']._catalog
+    assert len(tmpdir.listdir()) == 2
+
+    chameleon = LazyChameleonTranslations(translations)
+    assert chameleon['de_CH']('Homepage') == 'Startseite'
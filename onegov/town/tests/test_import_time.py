@@ -0,0 +1,33 @@
+import pytest
+import sys
+
+from onegov.town.import_time import measure_import, parse_import_times
+from onegov.town.import_time import total_time
+
+
+def test_parse_import_times():
+    times = list(parse_import_times((
+        "import time: self [us] | cumulative | imported package",
+        "import time:       500 |        500 |     _json",
+        "import time:      1000 |       1500 |   json.decoder",
+        "import time:      2000 |       3500 | json",
+        "import time:       100 |        100 | foo",
+        "something else",
+    )))
+
+    assert [t.module for t in times] == [
+        '_json', 'json.decoder', 'json', 'foo'
+    ]
+    assert [t.depth for t in times] == [2, 1, 0, 0]
+    assert times[1].self == 0.001
+    assert times[1].cumulative == 0.0015
+    assert total_time(times) == 0.0036
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires Python 3.7")
+def test_cli_imports_lazily():
+    modules = {t.module for t in measure_import('onegov.town.cli')}
+
+    assert 'onegov.town.cli' in modules
+    assert 'onegov.town.app' not in modules
+    assert 'onegov.org.app' not in modules
@@ -1,4 +1,5 @@
 
+import json
 import os
 
 from onegov.core.utils import module_path, rchop
@@ -6,6 +7,8 @@ from onegov.event import EventCollection, OccurrenceCollection
 from onegov.form import FormCollection
 from onegov.reservation import ResourceCollection
 from onegov.page import PageCollection
+from onegov.town.builtin_forms import builtin_forms, compile_builtin_forms
+from onegov.town.builtin_forms import CACHE_FILE
 
 
 def test_initial_content(town_app):
@@ -43,3 +46,43 @@ def test_initial_content(town_app):
 
     assert EventCollection(town_app.session()).query().count() == 4
     assert OccurrenceCollection(town_app.session()).query().count() > 4
+
+
+def test_builtin_forms():
+    forms = builtin_forms('de_CH')
+
+    # the forms are only loaded once
+    assert builtin_forms('de_CH') is forms
+    assert {f.name for f in forms} == {
+        rchop(p, '.form') for p in os.listdir(
+            module_path('onegov.town', 'forms/builtin/de'))
+        if p.endswith('.form')
+    }
+
+    form = next(f for f in forms if f.name == 'anmeldung_zuzug')
+    assert form.title == 'Anmeldung Zuzug'
+    assert form.has_required_email_field
+
+
+def test_compile_builtin_forms(tmpdir):
+    tmpdir.join('foo.form').write('Foo\n\n\nE-Mail *= @@@\n')
+
+    forms = compile_builtin_forms(str(tmpdir))
+    assert tmpdir.join(CACHE_FILE).exists()
+    assert forms[0].title == 'Foo'
+    assert forms[0].has_required_email_field
+    assert not tmpdir.listdir(lambda p: p.ext == '.tmp')
+
+    # unchanged forms are loaded from the cache
+    cache = json.loads(tmpdir.join(CACHE_FILE).read())
+    cache['forms']['foo']['title'] = 'Cached'
+    tmpdir.join(CACHE_FILE).write(json.dumps(cache))
+
+    assert compile_builtin_forms(str(tmpdir))[0].title == 'Cached'
+
+    # changed forms are compiled again
+    tmpdir.join('foo.form').write('Bar\n\n\nE-Mail *= @@@\n')
+    assert compile_builtin_forms(str(tmpdir))[0].title == 'Bar'
+
+    cache = json.loads(tmpdir.join(CACHE_FILE).read())
+    assert cache['forms']['foo']['title'] == 'Bar'
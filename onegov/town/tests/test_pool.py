@@ -0,0 +1,67 @@
+import transaction
+
+from onegov.core.orm import ModelBase
+from onegov.town.pool import SchemaPinnedSessionManager
+from sqlalchemy import Column, Integer, Text
+from sqlalchemy.ext.declarative import declarative_base
+
+
+def test_schema_pinned_pool(postgres_dsn):
+    Base = declarative_base(cls=ModelBase)
+
+    class Document(Base):
+        __tablename__ = 'document'
+        id = Column(Integer, primary_key=True)
+        title = Column(Text)
+
+    mgr = SchemaPinnedSessionManager(postgres_dsn, Base, pool_size=2)
+    stats = mgr.pool_stats
+
+    def title(schema):
+        mgr.set_current_schema(schema)
+        result = mgr.session().query(Document.title).scalar()
+        transaction.commit()
+
+        return result
+
+    for schema in ('foo', 'bar', 'baz'):
+        mgr.set_current_schema(schema)
+        mgr.session().add(Document(title=schema))
+        transaction.commit()
+
+    stats.clear()
+
+    # the connection pinned to the schema is used, without switching
+    assert title('baz') == 'baz'
+    assert title('baz') == 'baz'
+    assert stats['hits'] == 2
+    assert stats['switches'] == 0
+
+    assert title('foo') == 'foo'
+    assert stats['misses'] == 1
+    assert stats['switches'] == 1
+
+    # a search_path which is rolled back is not remembered
+    mgr.set_current_schema('bar')
+    assert mgr.session().query(Document.title).scalar() == 'bar'
+    transaction.abort()
+
+    assert title('foo') == 'foo'
+    assert title('baz') == 'baz'
+    assert title('bar') == 'bar'
+
+    # two sessions at the same time use two connections
+    mgr.set_current_schema('foo')
+    foo = mgr.session()
+    assert foo.query(Document.title).scalar() == 'foo'
+
+    mgr.set_current_schema('baz')
+    baz = mgr.session()
+    assert baz.query(Document.title).scalar() == 'baz'
+    assert foo.query(Document.title).scalar() == 'foo'
+    transaction.commit()
+
+    assert mgr.engine.pool.checkedin() == 2
+    assert 0 < mgr.pool_hit_rate < 1
+
+    mgr.dispose()
@@ -0,0 +1,23 @@
+from onegov.town import prewarm
+from onegov.town.prewarm import prewarm_application
+
+
+def test_prewarm_application(town_app, monkeypatch):
+    monkeypatch.setattr(prewarm, 'worker_app', town_app)
+
+    town_app.cache.delete('TownApp.has_publications')
+    town_app.cache.delete('TownApp.resource_ids_by_name')
+
+    result = prewarm_application(town_app.application_id)
+    assert result.application_id == town_app.application_id
+    assert not result.error
+
+    assert town_app.cache.get('TownApp.has_publications') is False
+    assert town_app.cache.get('TownApp.resource_ids_by_name') \
+        == town_app.resource_ids_by_name
+
+    # errors are returned, not raised
+    monkeypatch.setattr(town_app.__class__, 'org', None)
+
+    result = prewarm_application(town_app.application_id)
+    assert result.error.startswith('AttributeError')
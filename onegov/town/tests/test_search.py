@@ -0,0 +1,198 @@
+import transaction
+
+from onegov.search.errors import SearchOfflineError
+from onegov.town.search import BatchedIndexer, BatchedORMEventTranslator
+from onegov.town.search import collapse_tasks, MemoryBackend
+
+
+def index(id, title='', schema='foo'):
+    return {
+        'action': 'index',
+        'id': id,
+        'schema': schema,
+        'type_name': 'page',
+        'language': 'de',
+        'properties': {'title': title}
+    }
+
+
+def delete(id, schema='foo'):
+    return {
+        'action': 'delete',
+        'id': id,
+        'schema': schema,
+        'type_name': 'page'
+    }
+
+
+def batched_indexer(translator, backend, **kwargs):
+    # the client is only used by the elasticsearch backend
+    return BatchedIndexer(
+        None, translator.queue, es_client=object(), backend=backend,
+        **kwargs)
+
+
+def test_collapse_tasks():
+    # added, changed twice
+    assert list(collapse_tasks([
+        index(1, 'a'), delete(1), index(1, 'b'), delete(1), index(1, 'c')
+    ])) == [index(1, 'c')]
+
+    # changed twice
+    assert list(collapse_tasks([
+        delete(1), index(1, 'a'), delete(1), index(1, 'b')
+    ])) == [delete(1), index(1, 'b')]
+
+    # added and deleted
+    assert list(collapse_tasks([index(1), delete(1)])) == []
+
+    # changed and deleted
+    assert list(collapse_tasks([delete(1), index(1), delete(1)])) == [
+        delete(1)
+    ]
+
+    # the documents are kept apart
+    assert list(collapse_tasks([
+        index(1, 'a'), index(2), index(1, 'a', schema='bar'), index(1, 'b')
+    ])) == [index(1, 'b'), index(2), index(1, 'a', schema='bar')]
+
+
+def test_batched_indexing():
+    backend = MemoryBackend()
+    translator = BatchedORMEventTranslator(mappings=None)
+    indexer = batched_indexer(translator, backend, batch_size=2)
+
+    translator.after_commit = indexer.process
+
+    def change(*tasks):
+        with translator.buffered():
+            for task in tasks:
+                translator.put(task)
+
+    # the tasks of aborted transactions are dropped
+    transaction.begin()
+    change(index(1, 'a'))
+    transaction.abort()
+
+    assert translator.queue.empty()
+    assert backend.requests == 0
+
+    # the tasks are queued on commit and sent in batches
+    transaction.begin()
+    change(index(1, 'a'), index(2, 'b'))
+    change(delete(1), index(1, 'c'), index(3, 'd'))
+    assert translator.queue.empty()
+    transaction.commit()
+
+    assert translator.queue.empty()
+    assert backend.requests == 2
+    assert backend.documents == {
+        ('foo', 'page', 1): {'title': 'c'},
+        ('foo', 'page', 2): {'title': 'b'},
+        ('foo', 'page', 3): {'title': 'd'},
+    }
+
+    # tasks outside of the orm events are queued right away
+    translator.put(delete(2))
+    assert translator.queue.qsize() == 1
+
+    assert indexer.process() == 1
+    assert backend.ids('foo', 'page') == {1, 3}
+
+    # with a flush interval, batches are only sent once full
+    indexer.flush_interval = 3600
+    indexer.batch_size = 3
+
+    transaction.begin()
+    change(delete(1), index(1, 'e'))
+    transaction.commit()
+
+    assert backend.requests == 3
+    assert translator.queue.qsize() == 2
+
+    # (a task deleting another document fills the batch)
+    transaction.begin()
+    change(delete(3))
+    transaction.commit()
+
+    assert backend.requests == 4
+    assert backend.ids('foo', 'page') == {1}
+    assert backend.documents[('foo', 'page', 1)] == {'title': 'e'}
+
+    # unless they are flushed
+    translator.put(index(4))
+    assert indexer.process() == 0
+    assert indexer.flush() == 1
+    assert backend.ids('foo', 'page') == {1, 4}
+
+
+def test_batched_indexing_offline():
+    class OfflineBackend(MemoryBackend):
+        offline = True
+
+        def bulk(self, tasks):
+            if self.offline:
+                raise SearchOfflineError()
+
+            super().bulk(tasks)
+
+    backend = OfflineBackend()
+    translator = BatchedORMEventTranslator(mappings=None)
+    indexer = batched_indexer(translator, backend)
+
+    translator.put(index(1))
+    translator.put(index(2))
+
+    assert indexer.process() == 0
+    assert indexer.failed_batch == [index(1), index(2)]
+    assert translator.queue.empty()
+
+    backend.offline = False
+
+    assert indexer.process() == 2
+    assert indexer.failed_batch is None
+    assert backend.ids('foo', 'page') == {1, 2}
+
+
+def test_batched_indexing_savepoints():
+    backend = MemoryBackend()
+    translator = BatchedORMEventTranslator(mappings=None)
+    indexer = batched_indexer(translator, backend)
+
+    translator.after_commit = indexer.process
+
+    def change(*tasks):
+        with translator.buffered():
+            for task in tasks:
+                translator.put(task)
+
+    transaction.begin()
+    change(index(1, 'a'))
+
+    savepoint = transaction.savepoint()
+    change(index(2, 'b'), index(1, 'b'))
+    savepoint.rollback()
+
+    change(index(3, 'c'))
+
+    # savepoints taken before the first task work as well
+    transaction.commit()
+    transaction.begin()
+
+    savepoint = transaction.savepoint()
+    change(index(4, 'd'))
+    savepoint.rollback()
+
+    change(index(5, 'e'))
+
+    savepoint = transaction.savepoint()
+    change(index(6, 'f'))
+    savepoint.rollback()
+
+    transaction.commit()
+
+    assert backend.documents == {
+        ('foo', 'page', 1): {'title': 'a'},
+        ('foo', 'page', 3): {'title': 'c'},
+        ('foo', 'page', 5): {'title': 'e'},
+    }
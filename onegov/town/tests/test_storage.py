@@ -0,0 +1,70 @@
+import os
+import threading
+
+from depot.io.local import LocalFileStorage
+from onegov.town.storage import DeduplicatingFileStorage
+
+
+def test_deduplicating_file_storage(tmpdir):
+    tmpdir.mkdir('foo')
+    tmpdir.mkdir('bar')
+
+    foo = DeduplicatingFileStorage(str(tmpdir.join('foo')))
+    bar = DeduplicatingFileStorage(str(tmpdir.join('bar')))
+
+    def inode(storage, file_id):
+        return os.stat(
+            os.path.join(storage.storage_path, file_id, 'file')).st_ino
+
+    first = foo.create(b'image', 'image.jpg', 'image/jpeg')
+    second = bar.create(b'image', 'image.jpg', 'image/jpeg')
+    third = bar.create(b'other', 'other.jpg', 'image/jpeg')
+
+    assert foo.get(first).read() == b'image'
+    assert bar.get(second).read() == b'image'
+    assert bar.get(third).read() == b'other'
+
+    # identical files share a single blob
+    assert inode(foo, first) == inode(bar, second)
+    assert inode(bar, second) != inode(bar, third)
+    assert len(tmpdir.join('.blobs').listdir()) == 2
+
+    # removing a file only removes the link of the tenant
+    foo.delete(first)
+    assert bar.get(second).read() == b'image'
+
+    bar.replace(second, b'other')
+    assert bar.get(second).read() == b'other'
+    assert inode(bar, second) == inode(bar, third)
+
+    # the blob is removed with the last file linking to it
+    def blobs():
+        return [
+            blob.basename for directory in tmpdir.join('.blobs').listdir()
+            for blob in directory.listdir()
+        ]
+
+    assert len(blobs()) == 1
+
+    bar.delete(second)
+    assert len(blobs()) == 1
+    assert bar.get(third).read() == b'other'
+
+    bar.delete(third)
+    assert not blobs()
+
+    # temporary files of crashed processes are replaced
+    fourth = foo.create(b'image', 'image.jpg', 'image/jpeg')
+    fifth = LocalFileStorage.create(bar, b'image', 'image.jpg', 'image/jpeg')
+
+    path = os.path.join(bar.storage_path, fifth, 'file')
+    stale = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+    with open(stale, 'wb') as f:
+        f.write(b'')
+
+    bar.deduplicate(fifth)
+
+    assert not os.path.exists(stale)
+    assert bar.get(fifth).read() == b'image'
+    assert inode(foo, fourth) == inode(bar, fifth)
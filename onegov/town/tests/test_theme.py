@@ -0,0 +1,21 @@
+from onegov.core.theme import get_filename
+from onegov.town.theme import TownTheme
+from onegov.town.theme.town_theme import sources_hash
+
+
+def test_theme_version(tmpdir):
+    assert TownTheme().version == TownTheme().version
+
+    # the options are part of the filename, the version is not
+    assert get_filename(TownTheme(), {'primary-color': '#000'}) \
+        != get_filename(TownTheme(), {'primary-color': '#fff'})
+
+    for name, content in (('a', 'body{}'), ('b', 'body{}'), ('c', 'p{}')):
+        tmpdir.mkdir(name).join('town.scss').write(content)
+
+    def version(name, imports=('town', )):
+        return sources_hash((str(tmpdir.join(name)), ), imports)
+
+    assert version('a') == version('b')
+    assert version('a') != version('c')
+    assert version('a') != version('a', imports=('town', 'org'))
@@ -0,0 +1,76 @@
+import pytest
+
+from onegov.org.models import Organisation
+from onegov.town.upgrade import HOMEPAGE_STRUCTURES
+from onegov.town.upgrade import install_default_homepage_structure
+from onegov.town.upgrade import normalize_homepage_structure
+from onegov.town.upgrade import update_homepage_structure
+
+
+class Context(object):
+
+    def __init__(self, app):
+        self.app = app
+        self.session = app.session()
+
+
+def test_normalize_homepage_structure():
+    assert normalize_homepage_structure(None) is None
+    assert normalize_homepage_structure(' \n') is None
+
+    with pytest.raises(ValueError):
+        normalize_homepage_structure('<row>')
+
+    assert normalize_homepage_structure('<row>\n  <news />\n</row>') \
+        == normalize_homepage_structure('<row><news/></row>')
+
+    assert normalize_homepage_structure('<row><news/></row>') \
+        != normalize_homepage_structure('<row><events/></row>')
+
+
+def test_update_homepage_structure(town_app, capsys):
+    context = Context(town_app)
+    org = context.session.query(Organisation).one()
+
+    # the initial content already uses the latest structure
+    assert not update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=HOMEPAGE_STRUCTURES[:2])
+
+    org.meta['homepage_structure'] = HOMEPAGE_STRUCTURES[0]
+    assert update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=HOMEPAGE_STRUCTURES[:2])
+    assert org.meta['homepage_structure'] == HOMEPAGE_STRUCTURES[2]
+
+    output = capsys.readouterr().out
+    assert 'Homepage structure changed' in output
+    assert '+            <contacts_and_albums />' in output
+
+    org.meta['homepage_structure'] = '<row><column span="12"/></row>'
+    assert not update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=HOMEPAGE_STRUCTURES[:2])
+    assert org.meta['homepage_structure'] == '<row><column span="12"/></row>'
+    assert 'Custom homepage structure' in capsys.readouterr().out
+
+    # invalid structures are reported, instead of being replaced as empty
+    org.meta['homepage_structure'] = '<row>'
+    assert not update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=(None, ))
+    assert org.meta['homepage_structure'] == '<row>'
+    assert 'Invalid homepage structure' in capsys.readouterr().err
+
+    org.meta['homepage_structure'] = None
+    assert update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=(None, ))
+
+
+def test_install_default_homepage_structure(town_app):
+    context = Context(town_app)
+    org = context.session.query(Organisation).one()
+
+    install_default_homepage_structure(context)
+    assert org.meta['homepage_structure'] == HOMEPAGE_STRUCTURES[0]
+
+    # customised structures are kept
+    org.meta['homepage_structure'] = '<row><column span="12"/></row>'
+    install_default_homepage_structure(context)
+    assert org.meta['homepage_structure'] == '<row><column span="12"/></row>'
@@ -1,6 +1,14 @@
 import onegov.core
 import onegov.town
+import os
+import transaction
 
+from onegov.core.utils import module_path
+from onegov.org.models import Organisation
+from onegov.reservation import ResourceCollection
+from onegov.town.assets import fingerprint
+from onegov.town.homepage_cache import HomepageCache
+from onegov.town.views.settings import get_custom_settings_form
 from onegov_testing import Client, utils
 
 
@@ -89,3 +97,181 @@ def test_pages_on_homepage(es_town_app):
     )
 
     assert '0xdeadbeef' not in client.get('/')
+
+
+def test_services_panel_cache(town_app):
+    stats = town_app.__class__.services_panel_cache.stats
+    before = stats.copy()
+
+    client = Client(town_app)
+    client.get('/')
+    client.get('/')
+
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 1
+
+    # the links are absolute, so virtual hosts are cached separately
+    page = client.get('/', headers={'X_VHM_HOST': 'https://example.org'})
+    assert stats['misses'] - before['misses'] == 2
+    assert 'https://example.org/resource/sbb-tageskarte' in page
+
+    client.login_admin()
+    page = client.get('/homepage-settings')
+    page.form['daypass_label'] = 'Tageskarten der Gemeinde'
+    page.form.submit()
+
+    assert stats['invalidations'] > before['invalidations']
+    assert 'Tageskarten der Gemeinde' in client.get('/')
+
+
+def test_daypass_on_homepage(town_app):
+
+    def daypass_link():
+        for link in Client(town_app).get('/').pyquery('.panel-links a'):
+            if link.text and link.text.strip() == 'SBB Tageskarte':
+                return link.attrib['href']
+
+    assert daypass_link().endswith('/resource/sbb-tageskarte')
+
+    # the legacy name is used if there's no other daypass
+    resources = ResourceCollection(town_app.libres_context)
+    resources.by_name('sbb-tageskarte').name = 'ga-tageskarte'
+    transaction.commit()
+
+    assert daypass_link().endswith('/resource/ga-tageskarte')
+
+    resources.by_name('ga-tageskarte').name = 'gemeinde-tageskarte'
+    transaction.commit()
+
+    assert daypass_link() is None
+
+
+def test_homepage_cache(town_app):
+    town_app.homepage_cache = HomepageCache(shared=False)
+    stats = town_app.homepage_cache.stats
+
+    anonymous = Client(town_app)
+    assert '0xdeadbeef' not in anonymous.get('/')
+    assert '0xdeadbeef' not in anonymous.get('/')
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+    # logged in users are never served from the cache
+    editor = Client(town_app)
+    editor.login_editor()
+    editor.get('/')
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+
+    new_page = editor.get('/topics/bildung-gesellschaft').click('Thema')
+    new_page.form['title'] = "0xdeadbeef"
+    new_page = new_page.form.submit().follow()
+
+    edit_page = new_page.click('Bearbeiten')
+    edit_page.form['is_visible_on_homepage'] = True
+    edit_page.form.submit()
+
+    assert stats['invalidations'] >= 1
+    assert '0xdeadbeef' in anonymous.get('/')
+
+    # the links are absolute, so virtual hosts are cached separately
+    misses = stats['misses']
+    page = anonymous.get('/', headers={'X_VHM_HOST': 'https://example.org'})
+    assert stats['misses'] == misses + 1
+    assert 'https://example.org/' in page
+
+
+def test_widget_metrics(town_app):
+    client = Client(town_app)
+    assert 'Server-Timing' not in client.get('/').headers
+
+    town_app.configure_widget_metrics(widget_metrics=True)
+
+    timing = client.get('/').headers['Server-Timing']
+    assert 'services;dur=' in timing
+    assert 'contacts_and_albums;dur=' in timing
+    assert 'render;dur=' in timing
+    assert 'total;dur=' in timing
+
+    client.get('/')
+
+    metrics = town_app.widget_metrics.collect()
+    assert metrics['services']['calls'] == 2
+    assert metrics['contacts_and_albums']['calls'] == 2
+    assert metrics['contacts_and_albums']['statements'] == 0
+    assert metrics['render']['calls'] == 2
+
+    town_app.widget_metrics.reset()
+    assert not town_app.widget_metrics.collect()
+
+    # the homepage may still redirect to another part of the town
+    org = town_app.session().query(Organisation).one()
+    org.redirect_homepage_to = 'forms'
+    transaction.commit()
+
+    assert client.get('/').status_code == 302
+    assert not town_app.widget_metrics.collect()
+
+
+def test_static_files(town_app):
+    client = Client(town_app)
+
+    page = client.get('/')
+    link = page.pyquery('link[href*="font-awesome.min.css"]').attr('href')
+
+    path = module_path('onegov.org', 'static/font-awesome/css')
+    path = os.path.join(path, 'font-awesome.min.css')
+
+    # the link contains the hash of the content
+    assert link.endswith(f'___{fingerprint(path)}')
+
+    response = client.get(link)
+    assert 'immutable' in response.headers['Cache-Control']
+
+    etag = response.headers['ETag']
+    client.get(link, headers={'If-None-Match': etag}, status=304)
+
+    # the url is not parsed by onegov.core to check the hash
+    url = '/static/font-awesome/css/font-awesome.min.css___{}'
+    response = client.get(url.format(fingerprint(path)))
+    assert 'immutable' in response.headers['Cache-Control']
+
+    response = client.get(url.format(fingerprint(path)[1:]))
+    assert 'immutable' not in response.headers['Cache-Control']
+
+    # outdated links are served, but not cached forever
+    response = client.get(link.split('___')[0] + '___1.0.0')
+    assert 'immutable' not in response.headers['Cache-Control']
+
+
+def test_homepage_etag(town_app):
+    town_app.homepage_cache = HomepageCache(shared=False)
+    stats = town_app.homepage_cache.stats
+
+    client = Client(town_app)
+
+    etag = client.get('/').headers['ETag']
+    assert stats['misses'] == 1
+
+    # browsers revalidating the cached homepage receive a 304 reply
+    client.get('/', headers={'If-None-Match': etag}, status=304)
+    client.get('/', headers={'If-None-Match': '"outdated"'}, status=200)
+    assert stats['hits'] == 2
+
+
+def test_homepage_settings_form():
+    form_class = get_custom_settings_form(None, None)
+
+    assert get_custom_settings_form(None, None) is form_class
+
+    form = form_class()
+    assert 'daypass_label' in form
+    assert 'homepage_image_6' in form
+    assert 'homepage_cover' not in form
+    assert 'homepage_structure' not in form
+    assert 'redirect_homepage_to' not in form
+    assert 'redirect_path' not in form
+
+    names = [field.name for field in form]
+    assert names.index('daypass_label') \
+        == names.index('homepage_image_6') + 3
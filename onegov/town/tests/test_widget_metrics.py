@@ -0,0 +1,71 @@
+from onegov.town.widget_metrics import measure_widgets, MeasuredWidget
+from onegov.town.widget_metrics import server_timing, WidgetMetrics
+from types import SimpleNamespace
+
+
+def test_widget_metrics():
+    metrics = WidgetMetrics()
+    timings = []
+
+    with metrics.measure('news', timings):
+        metrics.on_statement()
+        metrics.on_statement()
+
+    # statements outside of a measurement are ignored
+    metrics.on_statement()
+
+    with metrics.measure('news', timings):
+        pass
+
+    assert [(name, statements) for name, d, statements in timings] == [
+        ('news', 2), ('news', 0)
+    ]
+
+    news = metrics.collect()['news']
+    assert news['calls'] == 2
+    assert news['statements'] == 2
+    assert news['max_duration'] <= news['duration']
+
+
+def test_server_timing():
+    assert server_timing([]) == ''
+    assert server_timing([('news', 0.0123, 2), ('render', 0.1, None)]) == (
+        'news;dur=12.3;desc="2 SQL statements", render;dur=100.0'
+    )
+
+
+def test_measure_widgets():
+
+    class Widget(object):
+        tag = 'news'
+        template = '<xsl:template match="news"/>'
+
+        def get_variables(self, layout):
+            return {'news': layout.app.name}
+
+    class StaticWidget(object):
+        tag = 'text'
+        template = '<xsl:template match="text"/>'
+
+    registry = {'news': Widget(), 'text': StaticWidget()}
+    measure_widgets(registry)
+    measure_widgets(registry)
+
+    news = registry['news']
+    assert isinstance(news, MeasuredWidget)
+    assert isinstance(news.widget, Widget)
+    assert news.template == Widget.template
+    assert isinstance(registry['text'], StaticWidget)
+
+    # widgets are only measured if the request collects the timings
+    app = SimpleNamespace(name='town', widget_metrics=WidgetMetrics())
+    request = SimpleNamespace(widget_timings=None)
+    layout = SimpleNamespace(app=app, request=request)
+    assert news.get_variables(layout) == {'news': 'town'}
+    assert not app.widget_metrics.collect()
+
+    request.widget_timings = timings = []
+    assert news.get_variables(layout) == {'news': 'town'}
+
+    assert [name for name, duration, statements in timings] == ['news']
+    assert app.widget_metrics.collect()['news']['calls'] == 1
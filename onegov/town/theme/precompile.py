@@ -0,0 +1,91 @@
+""" Precompiles the themes of many towns in parallel, e.g. before a new
+release receives traffic.
+
+The compiled themes are stored by theme name, version and options. Towns
+with the same options share a single compiled theme, which is therefore only
+compiled once. The precompressed variants of each theme are written as well
+(see :mod:`onegov.town.assets`).
+
+"""
+
+import time
+
+from collections import namedtuple, OrderedDict
+from multiprocessing import Pool
+from onegov.core.theme import get_filename
+from onegov.town.assets import compress_file
+
+
+#: the outcome of compiling a single theme
+ThemeResult = namedtuple(
+    'ThemeResult', ('filename', 'application_ids', 'duration', 'error'))
+
+
+def precompile_themes(app, application_ids, processes=None, force=False):
+    """ Compiles the themes of the given applications, using a pool of
+    processes. Yields a :class:`ThemeResult` for each theme which was
+    compiled, as soon as it is done.
+
+    Themes which already exist are skipped, unless ``force`` is True.
+
+    :param app:
+        A configured application instance, used to read the theme options
+        of each application and to store the themes.
+
+    :param application_ids:
+        The application ids (including the namespace).
+
+    """
+
+    theme = app.settings.core.theme
+    storage = app.themestorage
+
+    options = OrderedDict()
+    applications = OrderedDict()
+
+    for application_id in application_ids:
+        app.set_application_id(application_id)
+        app.clear_request_cache()
+
+        theme_options = app.theme_options
+        filename = get_filename(theme, theme_options)
+
+        options[filename] = theme_options
+        applications.setdefault(filename, []).append(application_id)
+
+    tasks = (
+        (filename, theme, options[filename]) for filename in options
+        if force or not storage.exists(filename)
+    )
+
+    with Pool(processes) as pool:
+        for filename, css, duration, error in pool.imap_unordered(
+                compile_theme, tasks):
+
+            if css is not None:
+                storage.setbytes(filename, css.encode('utf-8'))
+                compress_file(storage.getsyspath(filename), force=True)
+
+            yield ThemeResult(
+                filename, tuple(applications[filename]), duration, error)
+
+
+def compile_theme(task):
+    """ Compiles a single theme, used by :func:`precompile_themes`.
+
+    Errors are not raised, but returned as part of the result.
+
+    """
+    filename, theme, options = task
+
+    start = time.perf_counter()
+
+    try:
+        css = theme.compile(options)
+    except Exception as e:
+        css = None
+        error = f'{e.__class__.__name__}: {e}'
+    else:
+        error = None
+
+    return filename, css, time.perf_counter() - start, error
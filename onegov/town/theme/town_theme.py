@@ -1,3 +1,8 @@
+import hashlib
+import os
+import sass
+
+from onegov.core.cache import lru_cache
 from onegov.core.utils import module_path
 from onegov.org.theme import OrgTheme
 
@@ -8,12 +13,47 @@ user_options = {
 }
 
 
+@lru_cache(maxsize=16)
+def sources_hash(paths, imports):
+    """ Returns a hash of the scss files in the given paths, the given imports
+    and the version of the sass compiler.
+
+    The files are only read once per process.
+
+    """
+    digest = hashlib.sha1()
+    digest.update(sass.__version__.encode('utf-8'))
+    digest.update('\n'.join(imports).encode('utf-8'))
+
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+
+            for filename in sorted(files):
+                if not filename.endswith('.scss'):
+                    continue
+
+                filepath = os.path.join(root, filename)
+                digest.update(os.path.relpath(filepath, path).encode('utf-8'))
+
+                with open(filepath, 'rb') as f:
+                    digest.update(f.read())
+
+    return digest.hexdigest()
+
+
 class TownTheme(OrgTheme):
     name = 'onegov.town.foundation'
 
-    # don't touch this number, it's incremented using bumpversion, so every
-    # release will automatically trigger a rebuild of the theme
-    version = '1.15.10'
+    @property
+    def version(self):
+        """ The version of the theme, derived from its sources. The compiled
+        themes are stored by name, version and options. Therefore the theme
+        is only rebuilt if the sources change, not with every release.
+
+        """
+        paths = self.extra_search_paths + [self.foundation_path]
+        return sources_hash(tuple(paths), tuple(self.imports))
 
     @property
     def post_imports(self):
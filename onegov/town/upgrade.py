@@ -2,21 +2,18 @@
 upgraded on the server. See :class:`onegov.core.upgrade.upgrade_task`.
 
 """
+import click
 import textwrap
 
+from difflib import unified_diff
+from lxml import etree
 from onegov.core.upgrade import upgrade_task
 from onegov.org.models import Organisation
 
 
-@upgrade_task('Install the default homepage structure')
-def install_default_homepage_structure(context):
-
-    org = context.session.query(Organisation).first()
-
-    if org is None:
-        return
-
-    org.meta['homepage_structure'] = textwrap.dedent("""\
+#: the homepage structures installed by the upgrade tasks below, oldest first
+HOMEPAGE_STRUCTURES = (
+    textwrap.dedent("""\
         <row>
             <column span="8">
                 <homepage-tiles />
@@ -34,22 +31,8 @@ def install_default_homepage_structure(context):
                 </panel>
             </column>
         </row>
-    """)
-
-
-@upgrade_task('Install updated homepage structure')
-def install_updated_homepage_structure(context):
-
-    org = context.session.query(Organisation).first()
-
-    if org is None:
-        return
-
-    # not a town
-    if '<services />' not in org.meta['homepage_structure']:
-        return
-
-    org.meta['homepage_structure'] = textwrap.dedent("""\
+    """),
+    textwrap.dedent("""\
         <row>
             <column span="12">
                 <slider />
@@ -77,20 +60,8 @@ def install_updated_homepage_structure(context):
                 </panel>
             </column>
         </row>
-    """)
-
-
-@upgrade_task('Upgrade homepage structure to include directories')
-def upgrade_homepage_structure_to_include_directories(context):
-    org = context.session.query(Organisation).first()
-
-    if org is None:
-        return
-
-    if '<services />' not in org.meta['homepage_structure']:
-        return
-
-    org.meta['homepage_structure'] = textwrap.dedent("""\
+    """),
+    textwrap.dedent("""\
         <row>
             <column span="12">
                 <slider />
@@ -121,4 +92,92 @@ def upgrade_homepage_structure_to_include_directories(context):
                 </panel>
             </column>
         </row>
-    """)
+    """),
+)
+
+
+def normalize_homepage_structure(structure):
+    """ Returns the given homepage structure without insignificant
+    whitespace, so structures can be compared regardless of their
+    formatting. Returns None if the structure is empty.
+
+    Raises a ValueError if the structure is invalid.
+
+    """
+    if not structure or not structure.strip():
+        return None
+
+    parser = etree.XMLParser(remove_blank_text=True)
+
+    try:
+        root = etree.fromstring(f'<root>{structure}</root>', parser)
+    except etree.XMLSyntaxError as e:
+        raise ValueError(f"Invalid homepage structure: {e}") from e
+
+    return etree.tostring(root, encoding='unicode')
+
+
+def update_homepage_structure(context, structure, replaces):
+    """ Replaces the homepage structure of the organisation with the given
+    structure, if the current structure is one of the given structures to
+    be replaced (or if there is none and None is given).
+
+    Customised or invalid structures are left alone, as are structures
+    which would not change. The changes are printed as a diff, which allows
+    to review the changes of an upgrade run with ``--dry-run``.
+
+    Returns True if the structure was changed.
+
+    """
+    org = context.session.query(Organisation).first()
+
+    if org is None:
+        return False
+
+    application_id = context.app.application_id
+    current = org.meta.get('homepage_structure')
+
+    try:
+        normalized = normalize_homepage_structure(current)
+    except ValueError as e:
+        click.echo(f"{application_id}: {e}, not changed", err=True)
+        return False
+
+    if normalized == normalize_homepage_structure(structure):
+        return False
+
+    if normalized not in {normalize_homepage_structure(s) for s in replaces}:
+        click.echo(f"{application_id}: Custom homepage structure, not changed")
+        return False
+
+    diff = unified_diff(
+        (current or '').splitlines(keepends=True),
+        structure.splitlines(keepends=True),
+        fromfile='homepage_structure', tofile='homepage_structure'
+    )
+
+    click.echo(f"{application_id}: Homepage structure changed")
+    click.echo(''.join(diff))
+
+    org.meta['homepage_structure'] = structure
+    return True
+
+
+@upgrade_task('Install the default homepage structure')
+def install_default_homepage_structure(context):
+    # this used to replace any structure, customised ones are kept now
+    update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[0],
+        replaces=(None, ) + HOMEPAGE_STRUCTURES)
+
+
+@upgrade_task('Install updated homepage structure')
+def install_updated_homepage_structure(context):
+    update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[1], replaces=HOMEPAGE_STRUCTURES[:1])
+
+
+@upgrade_task('Upgrade homepage structure to include directories')
+def upgrade_homepage_structure_to_include_directories(context):
+    update_homepage_structure(
+        context, HOMEPAGE_STRUCTURES[2], replaces=HOMEPAGE_STRUCTURES[:2])
@@ -0,0 +1,52 @@
+""" The town homepage, measuring the widgets if enabled. """
+
+import time
+
+from onegov.core.security import Public
+from onegov.org.models import Organisation
+from onegov.org.views.homepage import view_org
+from onegov.town.app import TownApp
+from onegov.town.widget_metrics import server_timing
+
+
+@TownApp.html(model=Organisation, template='homepage.pt', permission=Public)
+def view_town(self, request):
+    """ Renders the town's homepage. """
+
+    @request.after
+    def add_etag(response):
+        # browsers revalidating the homepage receive a 304 reply, as long as
+        # it hasn't changed
+        if response.status_code == 200:
+            response.md5_etag()
+            response.conditional_response = True
+
+    metrics = request.app.widget_metrics
+
+    if metrics is None:
+        return view_org(self, request)
+
+    metrics.watch(request.session.bind)
+
+    start = time.perf_counter()
+
+    request.widget_timings = timings = []
+    variables = view_org(self, request)
+
+    # the homepage might redirect to another part of the town
+    if not isinstance(variables, dict):
+        return variables
+
+    rendering = time.perf_counter()
+
+    @request.after
+    def add_server_timing(response):
+        now = time.perf_counter()
+
+        timings.append(('render', now - rendering, None))
+        timings.append(('total', now - start, None))
+
+        metrics.record('render', now - rendering, None)
+        response.headers['Server-Timing'] = server_timing(timings)
+
+    return variables
@@ -0,0 +1,40 @@
+""" The availability of the daypasses, shown by the calendar. """
+
+from onegov.core.security import Public
+from onegov.org.models.resource import DaypassResource
+from onegov.town.app import TownApp
+
+
+#: the maximum number of weeks which may be requested
+MAX_WEEKS = 12
+
+
+def get_weeks(text, default=4):
+    try:
+        weeks = int(text)
+    except (TypeError, ValueError):
+        return default
+
+    return min(max(weeks, 1), MAX_WEEKS)
+
+
+@TownApp.json(model=DaypassResource, name='availability', permission=Public)
+def view_daypass_availability(self, request):
+    """ Returns the number of daypasses left per day, for the number of
+    weeks given by the ``weeks`` parameter (4 by default)::
+
+        {"2019-08-01": 3, "2019-08-02": 0}
+
+    """
+
+    weeks = get_weeks(request.params.get('weeks'))
+    availability = request.app.daypass_availability(self, weeks=weeks)
+
+    @request.after
+    def cache(response):
+        # only update once every minute
+        response.cache_control.max_age = 60
+
+    return {
+        date.isoformat(): left for date, left in availability.items()
+    }
@@ -10,49 +10,57 @@ from onegov.town.app import TownApp
 from wtforms import BooleanField, StringField
 
 
-def get_custom_settings_form(model, request):
+class CustomFieldsForm(Form):
+    online_counter_label = StringField(
+        label=_("Online Counter Label"),
+        description=_("Forms and applications"))
+
+    reservations_label = StringField(
+        label=_("Reservations Label"),
+        description=_("Daypasses and rooms"))
+
+    daypass_label = StringField(
+        label=_("SBB Daypass Label"),
+        description=_("Generalabonnement for Towns"))
 
-    class CustomFieldsForm(Form):
-        online_counter_label = StringField(
-            label=_("Online Counter Label"),
-            description=_("Forms and applications"))
+    publications_label = StringField(
+        label=_("Publications Label"),
+        description=_("Official Documents"))
 
-        reservations_label = StringField(
-            label=_("Reservations Label"),
-            description=_("Daypasses and rooms"))
+    hide_publications = BooleanField(
+        label=_("Hide Publications on Homepage"))
 
-        daypass_label = StringField(
-            label=_("SBB Daypass Label"),
-            description=_("Generalabonnement for Towns"))
 
-        publications_label = StringField(
-            label=_("Publications Label"),
-            description=_("Official Documents"))
+class TownHomepageSettingsForm(move_fields(
+    form_class=merge_forms(HomepageSettingsForm, CustomFieldsForm),
+    fields=(
+        'online_counter_label',
+        'reservations_label',
+        'daypass_label',
+        'publications_label',
+        'hide_publications',
+    ),
+    after='homepage_image_6'
+)):
+    """ The homepage settings of onegov.org, extended with the custom fields
+    and without the fields towns do not use.
 
-        hide_publications = BooleanField(
-            label=_("Hide Publications on Homepage"))
+    The class is built once, instead of on every request.
 
-    return move_fields(
-        form_class=merge_forms(HomepageSettingsForm, CustomFieldsForm),
-        fields=(
-            'online_counter_label',
-            'reservations_label',
-            'daypass_label',
-            'publications_label',
-            'hide_publications',
-        ),
-        after='homepage_image_6'
-    )
+    """
+
+    homepage_cover = None
+    homepage_structure = None
+    redirect_homepage_to = None
+    redirect_path = None
+
+
+def get_custom_settings_form(model, request):
+    return TownHomepageSettingsForm
 
 
 @TownApp.form(model=Organisation, name='homepage-settings', template='form.pt',
               permission=Secret, form=get_custom_settings_form,
               setting=_("Homepage"), icon='fa-home', order=-900)
 def custom_handle_settings(self, request, form):
-
-    form.delete_field('homepage_cover')
-    form.delete_field('homepage_structure')
-    form.delete_field('redirect_homepage_to')
-    form.delete_field('redirect_path')
-
     return handle_homepage_settings(self, request, form)
@@ -0,0 +1,56 @@
+""" Serves the static files and the themes with ETags, long-lived cache
+headers and precompressed variants (see :mod:`onegov.town.assets`).
+
+"""
+
+from onegov.core.security import Public
+from onegov.core.static import StaticFile
+from onegov.core.theme import ThemeFile
+from onegov.town.app import TownApp
+from onegov.town.assets import find_static_file, fingerprint, serve_file
+
+
+def requested_version(request):
+    """ Returns the version of the requested static file, as it appears in
+    the url.
+
+    The version parsed by onegov.core is not used, as it lacks the first
+    character (the separator is skipped with one character too many).
+
+    """
+    path, separator, version = request.path.rpartition('___')
+    return version if separator else None
+
+
+@TownApp.view(model=StaticFile, permission=Public)
+def view_static_file(self, request):
+    """ Renders the given static file in the browser. Files linked with
+    the hash of their content are cached for a year.
+
+    """
+
+    path = find_static_file(request.app, self.path)
+
+    # unlike onegov.core, an outdated version is not cached forever
+    immutable = requested_version(request) == fingerprint(path)
+
+    return serve_file(request, path, immutable=immutable)
+
+
+@TownApp.view(model=ThemeFile, permission=Public)
+def view_theme_file(self, request):
+    """ Renders the given theme in the browser. The filename of a theme
+    depends on its sources and options, so it's cached for a year, unless
+    the theme may be compiled again.
+
+    """
+
+    path = request.app.themestorage.getsyspath(self.path)
+
+    # a forced compilation (shift+f5) writes the theme to the same filename
+    immutable = not (
+        request.app.always_compile_theme
+        or request.app.allow_shift_f5_compile
+    )
+
+    return serve_file(request, path, immutable=immutable)
@@ -0,0 +1,155 @@
+""" Provides an optional instrumentation of the homepage widgets, measuring
+the time spent and the SQL statements executed by each widget.
+
+The instrumentation is opt-in and enabled through the application config::
+
+    widget_metrics: true
+
+If enabled, the widgets are wrapped once, when the application is
+configured (see :func:`measure_widgets`). The homepage responses carry a
+``Server-Timing`` header with the duration and the number of SQL statements
+of each widget, as well as the time spent rendering the homepage. The
+measurements are also collected in
+:attr:`onegov.town.TownApp.widget_metrics` (see :meth:`WidgetMetrics.collect`).
+
+Since the widget templates are part of a single homepage template, the time
+spent rendering them is measured as a whole.
+
+"""
+
+import threading
+import time
+
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+class WidgetMetrics(object):
+    """ Collects the duration and the number of SQL statements of the
+    homepage widgets of all requests handled by this process.
+
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.engines = set()
+
+        # the number of statements of the current measurement (per thread)
+        self.local = threading.local()
+
+    def watch(self, engine):
+        """ Counts the statements executed by the given engine. """
+
+        if engine not in self.engines:
+            event.listen(engine, 'before_cursor_execute', self.on_statement)
+            self.engines.add(engine)
+
+    def on_statement(self, *args, **kwargs):
+        if getattr(self.local, 'statements', None) is not None:
+            self.local.statements += 1
+
+    @contextmanager
+    def measure(self, name, timings):
+        """ Measures the code executed inside the context, adding the
+        result to the given list of timings of the current request.
+
+        """
+        self.local.statements = 0
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            statements = self.local.statements
+            self.local.statements = None
+
+            timings.append((name, duration, statements))
+            self.record(name, duration, statements)
+
+    def record(self, name, duration, statements):
+        with self.lock:
+            metric = self.metrics.setdefault(name, {
+                'calls': 0,
+                'duration': 0.0,
+                'max_duration': 0.0,
+                'statements': 0,
+            })
+
+            metric['calls'] += 1
+            metric['duration'] += duration
+            metric['max_duration'] = max(metric['max_duration'], duration)
+
+            if statements is not None:
+                metric['statements'] += statements
+
+    def collect(self):
+        """ Returns a copy of the metrics, keyed by name, containing the
+        number of calls, the total and the maximum duration (in seconds) and
+        the total number of SQL statements.
+
+        """
+        with self.lock:
+            return {
+                name: dict(metric) for name, metric in self.metrics.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.metrics.clear()
+
+
+class MeasuredWidget(object):
+    """ Wraps a homepage widget, measuring its variables if the request
+    collects the timings of the widgets (see
+    :attr:`onegov.town.request.TownRequest.widget_timings`).
+
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+
+    def __getattr__(self, name):
+        return getattr(self.widget, name)
+
+    def get_variables(self, layout):
+        timings = getattr(layout.request, 'widget_timings', None)
+
+        if timings is None:
+            return self.widget.get_variables(layout)
+
+        with layout.app.widget_metrics.measure(self.widget.tag, timings):
+            return self.widget.get_variables(layout)
+
+
+def measure_widgets(registry):
+    """ Wraps the widgets of the given homepage widget registry, so they are
+    measured by :func:`onegov.org.homepage_widgets.inject_widget_variables`.
+
+    The registry is shared by all applications of the same class, so this
+    is done once, when the application is configured. The wrapped widgets
+    only measure requests collecting the timings.
+
+    """
+
+    for tag, widget in tuple(registry.items()):
+        if isinstance(widget, MeasuredWidget):
+            continue
+
+        if hasattr(widget, 'get_variables'):
+            registry[tag] = MeasuredWidget(widget)
+
+
+def server_timing(timings):
+    """ Returns the value of a Server-Timing header for the given timings. """
+
+    def metric(name, duration, statements):
+        value = f'{name};dur={duration * 1000:.1f}'
+
+        if statements is not None:
+            value += f';desc="{statements} SQL statements"'
+
+        return value
+
+    return ', '.join(metric(*timing) for timing in timings)
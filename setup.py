@@ -48,7 +48,7 @@ setup(
     ),
     entry_points="""
         [console_scripts]
-        onegov-town=onegov.org.cli:cli
+        onegov-town=onegov.town.cli:cli
 
         [onegov]
         upgrade=onegov.town.upgrade